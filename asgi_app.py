@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Medical Study Prompt Generator - ASGI Server
+Async server mode: progress streams and status long-polls are served on an
+event loop, and generation jobs run on the async OpenAI client
+"""
+
+import os
+import sys
+import json
+import asyncio
+import functools
+import contextvars
+from pathlib import Path
+from urllib.parse import parse_qs
+
+# web_app must not start its thread-based startup work when imported here
+os.environ['WEB_ASYNC_MODE'] = '1'
+
+# Try importing the WSGI bridge used for the remaining Flask routes
+try:
+    from asgiref.wsgi import WsgiToAsgi
+    ASGIREF_AVAILABLE = True
+except ImportError:
+    ASGIREF_AVAILABLE = False
+    print("⚠️  Warning: asgiref not installed. Install with: pip install asgiref")
+
+try:
+    import uvicorn
+    UVICORN_AVAILABLE = True
+except ImportError:
+    UVICORN_AVAILABLE = False
+
+import web_app
+from web_app import (job_store, job_status_dict, job_or_404, create_generation_job,
+                     begin_job, open_generator, plan_questions, job_pipeline,
+                     finish_job, fail_job, cancel_job, end_job,
+                     preload_firstaid, get_catalog,
+                     MAX_CONCURRENT_JOBS, JOB_DB_PATH, EVENT_POLL_SECONDS, LONG_POLL_SECONDS,
+                     JOBS_QUEUED, SSE_SUBSCRIBERS)
+from pipeline import AsyncioExecutor, PIPELINE_WORKERS
+
+
+class ChangeNotifier:
+    """
+    Wakes coroutines when web_app reports a job change
+
+    Changes can be reported from any thread, so they are handed to the
+    event loop with call_soon_threadsafe. Each change sets the current
+    asyncio.Event and replaces it; waiters grab the event before reading
+    the store, so a change between the read and the wait is not missed.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self._event = None
+
+    def bind(self, loop):
+        """Start receiving web_app change notifications on this loop"""
+        self.loop = loop
+        self._event = asyncio.Event()
+        web_app.change_listeners.append(self.notify)
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self._fire)
+        except RuntimeError:
+            pass  # Loop already closed during shutdown
+
+    def _fire(self):
+        self._event.set()
+        self._event = asyncio.Event()
+
+    def current(self):
+        """Event that is set by the next change"""
+        return self._event
+
+    async def wait(self, event, timeout):
+        """Wait for a change (True) or the timeout (False)"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+notifier = ChangeNotifier()
+job_slots = None
+job_tasks = set()
+flask_app = WsgiToAsgi(web_app.app) if ASGIREF_AVAILABLE else None
+
+
+# Responses
+
+async def send_response(send, status, body=b'', content_type='application/json', headers=()):
+    """Send a complete response"""
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type.encode()),
+                    (b'content-length', str(len(body)).encode())] + list(headers)
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, payload, status=200, headers=()):
+    """Send a JSON response"""
+    await send_response(send, status, json.dumps(payload).encode(), headers=headers)
+
+
+async def read_body(receive):
+    """Read the full request body"""
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def request_headers(scope):
+    """Request headers as a lowercase str dict"""
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+
+
+async def to_thread(func, *args):
+    """
+    Run a blocking call on the default executor (asyncio.to_thread needs 3.9)
+
+    Store reads and writes go through here: SQLite can wait up to its busy
+    timeout for another process's write, which must not stall the loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+# Jobs
+
+def schedule_job(job_id):
+    """Run a stored job as a task; at most MAX_CONCURRENT_JOBS run at once"""
+    JOBS_QUEUED.inc()
+    task = asyncio.get_running_loop().create_task(run_generation_async(job_id))
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+
+
+async def run_generation_async(job_id):
+    """Run (or resume) a stored job with the async OpenAI client"""
+    async with job_slots:
+        # Another server process may have picked the job up first
+        job = await to_thread(begin_job, job_id)
+        if not job:
+            return
+
+        try:
+            # PDF parsing is CPU-bound, so it stays off the event loop
+            generator = await to_thread(open_generator, job_id, job['firstaid_pdf'])
+            plan = await to_thread(plan_questions, job_id, generator, job['input_pdf'])
+
+            # Process each question (PIPELINE_WORKERS at once); a cancel aborts the pending requests.
+            # Server shutdown cancels this task instead, and the job is resumed on the next start
+            pipeline = job_pipeline(job_id, generator, plan, AsyncioExecutor(PIPELINE_WORKERS))
+            outcome = await pipeline.arun(plan['questions'], plan['completed'], plan['cached_prompts'])
+
+            if outcome['status'] == 'cancelled':
+                await to_thread(cancel_job, job_id)
+            else:
+                await to_thread(finish_job, job_id, plan, job['output_csv'])
+
+        except Exception as e:
+            await to_thread(fail_job, job_id, e)
+
+        finally:
+            end_job(job_id)
+
+
+async def startup():
+    """Bind notifications to the loop, preload First Aid and resume unfinished jobs"""
+    global job_slots
+
+    notifier.bind(asyncio.get_running_loop())
+    job_slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+
+    firstaid = get_catalog(Path.cwd()).firstaid_pdf()
+    if firstaid:
+        asyncio.get_running_loop().run_in_executor(None, preload_firstaid, [firstaid])
+
+    # Jobs interrupted by a restart continue from their last completed question
+    for job_id in await to_thread(job_store.requeue_abandoned):
+        schedule_job(job_id)
+
+
+async def lifespan(receive, send):
+    """ASGI lifespan protocol"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Running jobs stay 'running' in the store and are resumed on the next start
+            for task in list(job_tasks):
+                task.cancel()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# Endpoints
+
+async def start_generation(receive, send):
+    """Queue a generation job and return its ID"""
+    try:
+        data = json.loads(await read_body(receive) or b'{}')
+    except ValueError:
+        return await send_json(send, {'success': False, 'error': 'Invalid JSON'}, status=400)
+
+    job, error = await to_thread(create_generation_job, data)
+    if error:
+        return await send_json(send, {'success': False, 'error': error})
+
+    schedule_job(job['id'])
+    await send_json(send, {'success': True, 'job_id': job['id']})
+
+
+async def job_progress(scope, receive, send, job):
+    """Server-sent events for one job, replayed from Last-Event-ID (see web_app.job_progress)"""
+    query = parse_qs(scope['query_string'].decode())
+    try:
+        after_id = int(request_headers(scope).get('last-event-id') or query.get('last_event_id', ['0'])[0])
+    except ValueError:
+        after_id = 0
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')]
+    })
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.get_running_loop().create_task(watch_disconnect())
+    SSE_SUBSCRIBERS.inc()
+    try:
+        while not disconnected.is_set():
+            change = notifier.current()
+
+            # Read the state first so no event logged before completion is missed
+            finished = (await to_thread(job_store.get_job, job['id']))['state'] not in ('queued', 'running')
+            events = await to_thread(job_store.get_events, job['id'], after_id)
+            for event_id, payload in events:
+                chunk = f"id: {event_id}\ndata: {json.dumps(payload)}\n\n"
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+                after_id = event_id
+
+            if events:
+                continue
+            if finished:
+                await send({'type': 'http.response.body', 'body': b"event: done\ndata: {}\n\n", 'more_body': True})
+                break
+
+            if not await notifier.wait(change, EVENT_POLL_SECONDS):
+                # Send heartbeat
+                chunk = f"data: {json.dumps({'heartbeat': True})}\n\n"
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        SSE_SUBSCRIBERS.dec()
+        watcher.cancel()
+
+
+async def job_status(scope, send, job):
+    """Job status with ETag and ?since=<version> long-poll (see web_app.job_status)"""
+    query = parse_qs(scope['query_string'].decode())
+    try:
+        since = int(query['since'][0]) if 'since' in query else None
+    except ValueError:
+        since = None
+
+    if since is not None:
+        deadline = asyncio.get_running_loop().time() + LONG_POLL_SECONDS
+        while job['version'] == since:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            change = notifier.current()
+            job = await to_thread(job_store.get_job, job['id'])
+            if job['version'] != since:
+                break
+            await notifier.wait(change, min(EVENT_POLL_SECONDS, remaining))
+
+    etag = f'"{job["id"]}-{job["version"]}"'
+    headers = [(b'etag', etag.encode()), (b'cache-control', b'no-cache')]
+    if_none_match = [tag.strip() for tag in request_headers(scope).get('if-none-match', '').split(',')]
+
+    if etag in if_none_match or (since is not None and job['version'] == since):
+        await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''})
+    else:
+        await send_json(send, job_status_dict(job), headers=headers)
+
+
+async def app(scope, receive, send):
+    """ASGI entry point: async endpoints here, everything else through Flask"""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    method = scope['method']
+    parts = scope['path'].strip('/').split('/')
+
+    # /api/progress and /api/status follow the latest job
+    job_id = None
+    if method == 'GET' and parts in (['api', 'progress'], ['api', 'status']):
+        job_id, action = 'latest', parts[1]
+    elif method == 'GET' and len(parts) == 4 and parts[:2] == ['api', 'jobs'] and parts[3] in ('progress', 'status'):
+        job_id, action = parts[2], parts[3]
+
+    if job_id:
+        job = await to_thread(job_or_404, job_id)
+        if not job:
+            if parts == ['api', 'status']:
+                return await send_json(send, {'is_running': False, 'current_question': 0, 'total_questions': 0,
+                                              'current_message': '', 'error': None, 'output_file': None})
+            return await send_json(send, {'error': 'Job not found'}, status=404)
+        if action == 'progress':
+            return await job_progress(scope, receive, send, job)
+        return await job_status(scope, send, job)
+
+    if method == 'POST' and parts == ['api', 'start_generation']:
+        return await start_generation(receive, send)
+
+    if flask_app is None:
+        return await send_json(send, {'error': 'asgiref is required for this endpoint in async mode'}, status=501)
+    # asgiref copies context variables back after each WSGI call; a fresh context keeps
+    # one request's executor state from leaking into the next on a keep-alive connection.
+    # The task copies the context it is created in (create_task(context=) needs 3.11)
+    await contextvars.Context().run(asyncio.get_running_loop().create_task, flask_app(scope, receive, send))
+
+
+if __name__ == '__main__':
+    if not UVICORN_AVAILABLE:
+        print("❌ Error: uvicorn not installed. Install with: pip install uvicorn asgiref")
+        print("   (or serve asgi_app:app with any other ASGI server)")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("🌐 Medical Study Prompt Generator - Web Interface (async)")
+    print("=" * 60)
+    print()
+    print("🚀 Starting server...")
+    print(f"⚙️  Up to {MAX_CONCURRENT_JOBS} generation jobs run at once (MAX_CONCURRENT_JOBS)")
+    print(f"🗄️  Job store: {JOB_DB_PATH}")
+    print()
+    print("Open your browser and go to:")
+    print()
+    print("    👉 http://localhost:5000")
+    print()
+    print("Press Ctrl+C to stop the server")
+    print("=" * 60)
+    print()
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+PDF Generator Benchmark Suite
+Synthesizes image folders and times PDFGenerator.create_pdf under each mode
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import random
+import platform
+import argparse
+import subprocess
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+from PIL import Image, ImageDraw
+
+# Add repository root to path for imports
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from generate_pdf_from_images import PDFGenerator
+
+
+IMAGE_SIZES = {
+    'small': (1024, 768),
+    '4k': (3840, 2160)
+}
+IMAGE_FORMATS = {
+    'png': ('PNG', '.png'),
+    'jpeg': ('JPEG', '.jpg')
+}
+DEFAULT_COUNTS = [10, 100, 1000, 5000]
+
+# Memory sampling interval for the process tree of a case (seconds)
+RSS_SAMPLE_INTERVAL = 0.05
+
+# PDFGenerator options per benchmarked mode
+MODES = {
+    'default': {},
+    'dpi150': {'target_dpi': 150},
+    'workers': {'target_dpi': 150, 'workers': 0},
+    'chunked': {'target_dpi': 150, 'chunk_pages': 200},
+    'volumes': {'target_dpi': 150, 'volumes': 0},
+    'incremental': {'target_dpi': 150, 'page_cache': '{work_dir}/{corpus}_page_cache'},
+    'budget': {'max_size': 25 * 1024 * 1024}
+}
+
+
+def synthesize_image(path, size, image_format, seed):
+    """Draw a screenshot-like image: background, text bars, boxes and a photo-like patch"""
+    rng = random.Random(seed)
+    width, height = size
+
+    img = Image.new('RGB', size, (250, 250, 250))
+    draw = ImageDraw.Draw(img)
+
+    # Text-like lines
+    line_height = max(12, height // 40)
+    for y in range(line_height, height // 2, line_height * 2):
+        line_width = rng.randint(width // 3, width - 40)
+        draw.rectangle([20, y, line_width, y + line_height // 2], fill=(40, 40, 40))
+
+    # Diagram boxes
+    for _ in range(8):
+        x0, y0 = rng.randint(0, width - 100), rng.randint(height // 2, height - 100)
+        color = tuple(rng.randint(60, 230) for _ in range(3))
+        draw.rectangle([x0, y0, x0 + rng.randint(40, width // 4), y0 + rng.randint(40, height // 6)],
+                       fill=color, outline=(0, 0, 0))
+
+    # Photo-like noisy patch (hard to compress, like illustrations)
+    patch_size = (width // 3, height // 3)
+    patch = Image.effect_noise(patch_size, rng.randint(20, 80)).convert('RGB')
+    img.paste(patch, (width - patch_size[0] - 20, 20))
+
+    pil_format = IMAGE_FORMATS[image_format][0]
+    if pil_format == 'JPEG':
+        img.save(path, format=pil_format, quality=90)
+    else:
+        img.save(path, format=pil_format)
+
+
+def ensure_corpus(corpus_dir, count, image_format, size_name):
+    """Create (or reuse) a folder of numbered synthetic images"""
+    folder = Path(corpus_dir) / f"{image_format}_{size_name}_{count}"
+    extension = IMAGE_FORMATS[image_format][1]
+    folder.mkdir(parents=True, exist_ok=True)
+
+    missing = [n for n in range(1, count + 1) if not (folder / f"{n}{extension}").exists()]
+    if missing:
+        print(f"  Synthesizing {len(missing)} images in {folder.name}...")
+        for n in missing:
+            synthesize_image(folder / f"{n}{extension}", IMAGE_SIZES[size_name], image_format, seed=n)
+
+    return folder
+
+
+def peak_rss_mb():
+    """Peak resident set size in MB of this process or its largest child, or None without resource (Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    max_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux reports kilobytes, macOS bytes
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+def tree_rss_mb(root_pid):
+    """Current RSS in MB of a process and all its descendants, or None without /proc (Linux only)"""
+    children = {}
+    try:
+        pids = [int(name) for name in os.listdir('/proc') if name.isdigit()]
+    except OSError:
+        return None
+
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue  # Process exited while listing
+        # The command name may contain spaces; fields after it are "state ppid ..."
+        ppid = int(stat[stat.rindex(b')') + 2:].split()[1])
+        children.setdefault(ppid, []).append(pid)
+
+    total_pages = 0
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, ()))
+        try:
+            with open(f'/proc/{pid}/statm', 'r') as f:
+                total_pages += int(f.read().split()[1])
+        except OSError:
+            pass
+    return total_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class TreeRSSSampler:
+    """
+    Track the peak summed RSS of this process and its worker processes
+
+    getrusage only reports the largest single child, which under-reports the
+    workers and volumes modes, so the process tree is sampled instead.
+    """
+
+    def __init__(self):
+        self.peak_mb = tree_rss_mb(os.getpid())
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if self.peak_mb is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.peak_mb is not None:
+            self._stop.set()
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(os.getpid()) or 0)
+
+
+def run_case(folder, output_pdf, options, result_queue):
+    """
+    Build one PDF in a fresh process and report timing and memory
+
+    peak_rss_mb is the sampled peak of the summed RSS of the process tree
+    ('process_tree'). Without /proc it falls back to getrusage, which only
+    sees the largest single process ('largest_process') and under-reports
+    modes with worker processes. With neither it is None and reported as n/a.
+    """
+    # Silence progress output at the descriptor level so worker processes inherit it
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+
+    sampler = TreeRSSSampler()
+    start = time.perf_counter()
+    result = {'success': False}
+    try:
+        with sampler:
+            generator = PDFGenerator(title="Benchmark", **options)
+            result['success'] = generator.create_pdf(folder, output_pdf)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        result['wall_time_s'] = time.perf_counter() - start
+        if sampler.peak_mb is not None:
+            result.update(peak_rss_mb=sampler.peak_mb, rss_method='process_tree')
+        else:
+            peak = peak_rss_mb()
+            result.update(peak_rss_mb=peak, rss_method='largest_process' if peak is not None else None)
+        result_queue.put(result)
+
+
+def run_in_subprocess(folder, output_pdf, options):
+    """Run a benchmark case in a fresh process so peak RSS is per case"""
+    context = multiprocessing.get_context('spawn')
+    result_queue = context.Queue()
+    process = context.Process(target=run_case, args=(folder, output_pdf, options, result_queue))
+    process.start()
+
+    # A child killed before reporting (e.g. by the OOM killer) never puts a result
+    while True:
+        try:
+            result = result_queue.get(timeout=1)
+            break
+        except queue.Empty:
+            if process.is_alive():
+                continue
+            try:
+                result = result_queue.get(timeout=1)  # Reported just before exiting
+            except queue.Empty:
+                result = {'success': False, 'error': f"benchmark process exited with code {process.exitcode}",
+                          'wall_time_s': 0.0, 'peak_rss_mb': 0.0, 'rss_method': None}
+            break
+
+    process.join()
+    return result
+
+
+def measure(folder, mode, work_dir):
+    """Benchmark one mode on one corpus"""
+    options = {key: value.format(work_dir=work_dir, corpus=folder.name) if isinstance(value, str) else value
+               for key, value in MODES[mode].items()}
+    output_pdf = Path(work_dir) / f"{folder.name}_{mode}.pdf"
+
+    if 'page_cache' in options:
+        # Incremental mode is measured as a warm rebuild after a cold build
+        cold = run_in_subprocess(folder, output_pdf, options)
+        result = run_in_subprocess(folder, output_pdf, options)
+        result['cold_wall_time_s'] = cold['wall_time_s']
+    else:
+        result = run_in_subprocess(folder, output_pdf, options)
+
+    image_count = len([p for p in folder.iterdir() if not p.name.startswith('.')])
+    pages = (image_count + 1) // 2 + 1
+    result.update({
+        'output_bytes': output_pdf.stat().st_size if output_pdf.exists() else 0,
+        'pages': pages,
+        'pages_per_second': pages / result['wall_time_s'] if result['success'] and result['wall_time_s'] else 0
+    })
+    if output_pdf.exists():
+        output_pdf.unlink()
+    return result
+
+
+def git_commit():
+    """Current commit hash, if run inside a git checkout"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=Path(__file__).resolve().parent, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path, results):
+    """Print wall time and size changes against an earlier results file"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def case_key(r):
+        return r['corpus'], r['mode']
+
+    previous = {case_key(r): r for r in baseline['results']}
+
+    print()
+    print(f"Compared with {baseline.get('commit') or baseline_path}:")
+    print(f"  {'corpus':<22} {'mode':<12} {'time':>10} {'size':>10} {'rss':>10}")
+    for r in results:
+        old = previous.get(case_key(r))
+        if not old:
+            continue
+
+        def delta(field):
+            if not old[field] or r[field] is None:
+                return 'n/a'
+            return f"{(r[field] - old[field]) / old[field] * 100:+.1f}%"
+
+        print(f"  {r['corpus']:<22} {r['mode']:<12} {delta('wall_time_s'):>10} "
+              f"{delta('output_bytes'):>10} {delta('peak_rss_mb'):>10}")
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        description='Benchmark PDFGenerator on synthetic image folders',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Quick smoke run
+  python3 benchmarks/bench_pdf_generator.py --counts 10 100 --sizes small
+
+  # Full suite, compared with an earlier run
+  python3 benchmarks/bench_pdf_generator.py -o new.json --compare old.json
+        """
+    )
+    parser.add_argument('--counts', type=int, nargs='+', default=DEFAULT_COUNTS,
+                        help='Image counts per corpus (default: 10 100 1000 5000)')
+    parser.add_argument('--formats', nargs='+', default=list(IMAGE_FORMATS), choices=list(IMAGE_FORMATS),
+                        help='Source image formats (default: png jpeg)')
+    parser.add_argument('--sizes', nargs='+', default=list(IMAGE_SIZES), choices=list(IMAGE_SIZES),
+                        help='Source image sizes (default: small 4k)')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES),
+                        help='PDFGenerator modes to run (default: all)')
+    parser.add_argument('--corpus-dir', default=str(Path(__file__).resolve().parent / '.corpus'),
+                        help='Where synthetic image folders are cached')
+    parser.add_argument('-o', '--output', default='bench_results.json',
+                        help='Results JSON file (default: bench_results.json)')
+    parser.add_argument('--compare', default=None,
+                        help='Earlier results JSON to compare against')
+
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("⏱️  PDF Generator Benchmark")
+    print("=" * 60)
+    print()
+
+    work_dir = Path(args.corpus_dir) / '_work'
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    results = []
+    for image_format in args.formats:
+        for size_name in args.sizes:
+            for count in args.counts:
+                folder = ensure_corpus(args.corpus_dir, count, image_format, size_name)
+
+                for mode in args.modes:
+                    result = measure(folder, mode, work_dir)
+                    result.update({
+                        'corpus': folder.name,
+                        'count': count,
+                        'format': image_format,
+                        'size': size_name,
+                        'mode': mode
+                    })
+                    results.append(result)
+
+                    if result.get('error'):
+                        print(f"  {folder.name:<22} {mode:<12} ❌ {result['error']}")
+                        continue
+
+                    rss = result['peak_rss_mb']
+                    rss = f"{rss:8.0f} MB" if rss is not None else f"{'n/a':>11}"
+                    print(f"  {folder.name:<22} {mode:<12} {result['wall_time_s']:8.2f}s "
+                          f"{result['pages_per_second']:8.1f} pages/s "
+                          f"{rss} RSS "
+                          f"{result['output_bytes'] / (1024 * 1024):8.1f} MB")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print(f"💾 Results saved to: {args.output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+"""
+File Hashing
+Content hashes shared by the prompt generator and the PDF and image catalogs
+"""
+
+import hashlib
+
+
+HASH_BLOCK_BYTES = 1024 * 1024
+
+
+def file_sha256(path) -> str:
+    """SHA-256 of a file, read in 1 MB blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
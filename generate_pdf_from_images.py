@@ -6,28 +6,390 @@ Creates a PDF with 2 images per page in a clean, professional layout
 
 import os
 import sys
+import re
+import json
+import time
+import zlib
+import hashlib
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
 from pathlib import Path
-from PIL import Image
+from PIL import Image, ImageOps
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from reportlab.lib.utils import ImageReader
 from reportlab.lib import colors
+from reportlab.pdfbase import pdfdoc
+from reportlab import rl_config
 from reportlab.platypus import Table, TableStyle
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject,
+                            NumberObject, StreamObject)
+from image_catalog import ImageCatalog, image_header
 import argparse
 from datetime import datetime
 
 
+IMAGE_FORMATS = ('jpeg', 'flate')
+
+# JPEG color modes that can be embedded as-is; CMYK needs Adobe-specific
+# Decode handling, so it goes through normalization instead
+PASSTHROUGH_MODES = ('RGB', 'L')
+
+# Name of the form XObject holding the static header/footer of content pages
+PAGE_CHROME_FORM = 'page_chrome'
+
+# Bump when page rendering or image normalization (prepare_image, EXIF handling)
+# changes so cached page fragments are re-rendered.
+# 2: JPEGs with an EXIF orientation are rotated in every mode
+PAGE_CACHE_VERSION = 2
+
+# Page cache files: fragments are page_<sha256>.pdf, and each deck built from the
+# cache has a deck_<hash of output path>.json manifest listing the fragments it uses
+PAGE_FRAGMENT_RE = re.compile(r'page_[0-9a-f]{64}\.pdf')
+
+# Size budget search (--max-size): bounds and estimate overheads
+SIZE_SAMPLE_COUNT = 16
+MIN_BUDGET_QUALITY = 40
+MIN_BUDGET_DPI = 72
+DEFAULT_BUDGET_DPI = 300
+PAGE_OVERHEAD_BYTES = 2 * 1024
+DOCUMENT_OVERHEAD_BYTES = 16 * 1024
+SIZE_BUDGET_MARGIN = 0.95  # Aim slightly under the budget to absorb estimate error
+SIZE_BUDGET_RETRIES = 3  # Re-renders with corrected estimates when the output is still too large
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse a size such as '25MB', '800 KB' or '1048576' into bytes"""
+    text = str(text).strip().upper().replace(' ', '')
+    for unit in ('GB', 'MB', 'KB', 'B'):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * SIZE_UNITS[unit])
+    return int(float(text))
+
+
+def format_size(num_bytes):
+    """Human-readable size in MB"""
+    return f"{num_bytes / SIZE_UNITS['MB']:.1f} MB"
+
+
+def fit_image(img_width, img_height, box_width, box_height):
+    """Scale image dimensions to fit inside a box, leaving 5% padding"""
+    scale = min(box_width / img_width, box_height / img_height)
+    return img_width * scale * 0.95, img_height * scale * 0.95
+
+
+def can_passthrough(header, box, target_dpi=None):
+    """
+    Check from the header alone whether a JPEG can be embedded without decoding
+    
+    header holds the image_header() fields (from the file or the image
+    catalog). True when the file is an RGB or grayscale JPEG that needs no
+    EXIF rotation and is not larger than target_dpi requires at its printed size.
+    """
+    if header['format'] != 'JPEG' or header['mode'] not in PASSTHROUGH_MODES:
+        return False
+    
+    if header['orientation'] != 1:
+        return False
+    
+    if target_dpi:
+        width_pt, height_pt = fit_image(header['width'], header['height'], *box)
+        return (header['width'] <= round(width_pt / 72 * target_dpi) and
+                header['height'] <= round(height_pt / 72 * target_dpi))
+    
+    return True
+
+
+def passthrough_info(image_path, width, height, mode):
+    """Describe a JPEG file that is embedded as its original DCT stream"""
+    return {
+        'format': 'jpeg',
+        'path': str(image_path),
+        'width': width,
+        'height': height,
+        'color_space': 'DeviceGray' if mode == 'L' else 'DeviceRGB'
+    }
+
+
+def prepare_image(image_path, box, target_dpi=None, image_format='jpeg', jpeg_quality=85,
+                  passthrough=True):
+    """
+    Normalize an image into a ready-to-embed buffer
+    
+    Module-level so it can run in worker processes. Applies EXIF orientation,
+    flattens transparency onto white, reduces the color mode to RGB or
+    grayscale, resamples to target_dpi at the printed size and encodes the
+    pixels as a JPEG (DCT) or zlib (Flate) stream. JPEGs that need none of
+    this are passed through untouched (see can_passthrough).
+    
+    Args:
+        image_path: Path to the source image
+        box: (width, height) in points of the area the image is fitted into
+        target_dpi: Resample to this DPI (None keeps the original resolution)
+        image_format: 'jpeg' or 'flate'; without target_dpi the pixels are
+                      kept lossless and Flate is always used
+        jpeg_quality: JPEG quality (1-95)
+        passthrough: False re-encodes JPEGs that could be embedded as-is, so
+                     every image gets jpeg_quality (used by the size budget)
+    
+    Returns:
+        Dict with format, width, height, color_space and either the encoded
+        data or, for passthrough JPEGs, the source path
+    """
+    with Image.open(image_path) as img:
+        # Header only: JPEGs that already fit are never decoded
+        if passthrough and can_passthrough(image_header(img), box, target_dpi):
+            return passthrough_info(image_path, img.width, img.height, img.mode)
+        
+        img = ImageOps.exif_transpose(img)
+    
+    # PDF images are opaque here - flatten any transparency onto white
+    if img.mode in ('RGBA', 'LA', 'PA', 'P') or 'transparency' in img.info:
+        img = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel('A'))
+        img = background
+    elif img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    
+    if target_dpi:
+        # Pixels needed to cover the drawn area at the target DPI (72 pt = 1 inch)
+        width_pt, height_pt = fit_image(img.width, img.height, *box)
+        target_w = max(1, round(width_pt / 72 * target_dpi))
+        target_h = max(1, round(height_pt / 72 * target_dpi))
+        
+        # Never upsample - small images are embedded at their own resolution
+        if img.width > target_w or img.height > target_h:
+            img = img.resize((target_w, target_h), Image.LANCZOS)
+    else:
+        image_format = 'flate'
+    
+    if image_format == 'jpeg':
+        buffer = BytesIO()
+        img.save(buffer, format='JPEG', quality=jpeg_quality, optimize=True)
+        data = buffer.getvalue()
+    else:
+        data = zlib.compress(img.tobytes())
+    
+    return {
+        'format': image_format,
+        'data': data,
+        'width': img.width,
+        'height': img.height,
+        'color_space': 'DeviceGray' if img.mode == 'L' else 'DeviceRGB'
+    }
+
+
+class PDFConcatenator:
+    """
+    Concatenate PDF files into one, holding a single source file's objects at a time
+    
+    PyPDF2's PdfWriter keeps every appended page until write(), so merging
+    with it holds the whole document in memory. Here each source is read
+    from an open file, its pages and the objects they use are written
+    straight to the output with new object numbers, and the reader is
+    dropped before the next file. Only object offsets and page references
+    are kept for the page tree and cross-reference table written by close().
+    """
+    
+    CATALOG_ID = 1
+    PAGES_ID = 2
+    
+    def __init__(self, output_pdf):
+        self._out = open(output_pdf, 'wb')
+        self._out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._offsets = [None, None]  # Catalog and page tree, written by close()
+        self._kids = ArrayObject()
+    
+    def append(self, pdf_path):
+        """Copy every page of a PDF file to the output"""
+        with open(pdf_path, 'rb') as f:
+            # A file object (not a path) keeps PdfReader from loading the whole file
+            reader = PdfReader(f)
+            new_ids = {}
+            pending = deque()
+            
+            page_ids = set()
+            for page in reader.pages:
+                page_ids.add(page.indirect_reference.idnum)
+                self._kids.append(self._reference(page.indirect_reference, new_ids, pending))
+            
+            while pending:
+                ref = pending.popleft()
+                obj = ref.get_object()
+                if ref.idnum in page_ids:
+                    # Re-parent pages under the new page tree instead of copying the old one
+                    page = DictionaryObject({key: value for key, value in obj.items() if key != '/Parent'})
+                    obj = self._remap(page, new_ids, pending)
+                    obj[NameObject('/Parent')] = IndirectObject(self.PAGES_ID, 0, None)
+                else:
+                    obj = self._remap(obj, new_ids, pending)
+                self._write_object(new_ids[ref.idnum].idnum, obj)
+            
+            # Reader objects point back at the reader, so the cycle would keep this
+            # file's objects alive until the next garbage collection - drop them now
+            reader.resolved_objects.clear()
+            reader.flattened_pages = None
+    
+    def close(self):
+        """Write the page tree, catalog and cross-reference table"""
+        self._write_object(self.PAGES_ID, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): self._kids,
+            NameObject('/Count'): NumberObject(len(self._kids))
+        }))
+        self._write_object(self.CATALOG_ID, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGES_ID, 0, None)
+        }))
+        
+        xref_offset = self._out.tell()
+        self._out.write(f"xref\n0 {len(self._offsets) + 1}\n".encode())
+        self._out.write(b"0000000000 65535 f \n")
+        for offset in self._offsets:
+            self._out.write(f"{offset:010d} 00000 n \n".encode())
+        
+        self._out.write(b"trailer\n")
+        DictionaryObject({
+            NameObject('/Size'): NumberObject(len(self._offsets) + 1),
+            NameObject('/Root'): IndirectObject(self.CATALOG_ID, 0, None)
+        }).write_to_stream(self._out, None)
+        self._out.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        self._out.close()
+    
+    def _reference(self, ref, new_ids, pending):
+        """Output reference for a source object, queueing it to be copied on first use"""
+        if ref.idnum not in new_ids:
+            self._offsets.append(None)
+            new_ids[ref.idnum] = IndirectObject(len(self._offsets), 0, None)
+            pending.append(ref)
+        return new_ids[ref.idnum]
+    
+    def _remap(self, obj, new_ids, pending):
+        """Copy a direct object, pointing its references at output object numbers"""
+        if isinstance(obj, IndirectObject):
+            return self._reference(obj, new_ids, pending)
+        
+        if isinstance(obj, StreamObject):
+            # The stream data is copied still encoded; Length is rewritten on output
+            stream = StreamObject()
+            stream._data = obj._data
+            stream.update({key: self._remap(value, new_ids, pending)
+                           for key, value in obj.items() if key != '/Length'})
+            return stream
+        
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({key: self._remap(value, new_ids, pending)
+                                     for key, value in obj.items()})
+        
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._remap(item, new_ids, pending) for item in obj)
+        
+        return obj
+    
+    def _write_object(self, obj_id, obj):
+        """Write one numbered object and record its offset"""
+        self._offsets[obj_id - 1] = self._out.tell()
+        self._out.write(f"{obj_id} 0 obj\n".encode())
+        obj.write_to_stream(self._out, None)
+        self._out.write(b"\nendobj\n")
+
+
 class PDFGenerator:
-    def __init__(self, title="NBME 30", additional_text="", page_size=letter):
+    def __init__(self, title="NBME 30", additional_text="", page_size=letter,
+                 target_dpi=None, image_format='jpeg', jpeg_quality=85, workers=None,
+                 chunk_pages=None, page_cache=None, volumes=None, max_size=None):
+        """
+        Args:
+            title: Title shown on the title page and page headers
+            additional_text: Optional subtitle for the title page
+            page_size: reportlab page size tuple (letter or A4)
+            target_dpi: Resample images to this DPI at their printed size
+                        (None embeds the original files unchanged)
+            image_format: Re-encoding used when resampling ('jpeg' or 'flate')
+            jpeg_quality: JPEG quality (1-95) when image_format is 'jpeg'
+            workers: Normalize images in this many worker processes
+                     (0 = one per CPU core, None = no preprocessing stage)
+            chunk_pages: Stream the PDF in chunks of this many pages written to
+                         temporary files and concatenated at the end, so memory
+                         no longer grows with the number of images
+            page_cache: Directory of rendered page fragments; only pages whose
+                        images or layout changed are re-rendered
+            volumes: Split the pages into this many ranges rendered in parallel
+                     processes and merged (0 = one per CPU core)
+            max_size: Output size budget in bytes; DPI and JPEG quality are
+                      chosen from a sample of images before rendering
+        """
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"image_format must be one of {IMAGE_FORMATS}, got {image_format!r}")
+        
         self.title = title
         self.additional_text = additional_text
         self.page_size = page_size
         self.width, self.height = page_size
         self.margin = 0.75 * inch
+        self.target_dpi = target_dpi
+        self.image_format = image_format
+        self.jpeg_quality = jpeg_quality
+        self.workers = workers
+        self.chunk_pages = chunk_pages
+        self.page_cache = Path(page_cache) if page_cache else None
+        self.volumes = volumes
+        self.max_size = max_size
+        
+        # Catalog of the image folder (metadata and hashes), set by _find_images
+        self._catalog = None
         
-    def create_pdf(self, image_folder, output_pdf):
-        """Create PDF from images in folder"""
+        # Progress callback and start time of the current create_pdf call
+        self._progress = None
+        self._started = None
+        
+        # Size budget state: the settings requested for the current call (the
+        # chosen ones only last for that call), uncorrected estimates by
+        # (dpi, quality, format, passthrough), the estimate for the chosen
+        # settings, and the measured/estimated size ratio
+        self._requested = None
+        self._passthrough = True
+        self._size_estimates = {}
+        self._budget_estimate = None
+        self._budget_correction = 1.0
+    
+    def __getstate__(self):
+        # Progress callbacks (often bound to GUI objects) stay in the parent process
+        state = self.__dict__.copy()
+        state['_progress'] = None
+        return state
+        
+    def create_pdf(self, image_folder, output_pdf, progress=None):
+        """
+        Create PDF from images in folder
+        
+        progress, if given, is called (on this thread) with one dict per event:
+            {'event': 'start', 'images': n, 'total_pages': n}
+            {'event': 'page', 'page': n, 'total_pages': n, 'seconds': s, 'cached': bool}
+            {'event': 'stage', 'message': text}     e.g. merging chunks or volumes
+            {'event': 'warning', 'message': text}   e.g. an image that could not be added
+            {'event': 'done', 'output': path, 'total_pages': n}
+        Every event also carries 'elapsed', the seconds since create_pdf started.
+        """
+        self._progress = progress
+        self._started = time.perf_counter()
+        self._requested = (self.target_dpi, self.image_format, self.jpeg_quality)
+        try:
+            return self._create_pdf(image_folder, output_pdf)
+        finally:
+            self._progress = None
+            # Settings chosen for a size budget do not carry over to the next call
+            self.target_dpi, self.image_format, self.jpeg_quality = self._requested
+            self._passthrough = True
+    
+    def _create_pdf(self, image_folder, output_pdf):
+        """create_pdf without the progress bookkeeping"""
         print("=" * 60)
         print("📄 Professional PDF Generator")
         print("=" * 60)
@@ -41,77 +403,432 @@ class PDFGenerator:
             return False
         
         print(f"✓ Found {len(images)} images")
+        
+        # Add images (2 per page)
+        total_pages = (len(images) + 1) // 2  # Round up
+        self._report('start', images=len(images), total_pages=total_pages)
+        
+        if self.max_size:
+            self._size_estimates = {}
+            self._budget_correction = 1.0
+            self._fit_size_budget(images, total_pages)
+        
         print(f"📝 Title: {self.title}")
         if self.additional_text:
             print(f"📝 Additional text: {self.additional_text}")
+        if self.target_dpi:
+            encoding = f"JPEG q{self.jpeg_quality}" if self.image_format == 'jpeg' else "Flate"
+            print(f"🖼️  Resampling: {self.target_dpi} DPI, {encoding}")
+        if self.workers is not None:
+            print(f"⚙️  Preprocessing: {self._worker_count()} worker processes")
         print()
         
-        # Create PDF
-        c = canvas.Canvas(str(output_pdf), pagesize=self.page_size)
+        self._write_pdf(images, output_pdf, total_pages)
+        if self.max_size:
+            self._enforce_size_budget(images, output_pdf, total_pages)
         
-        # Add title page
-        self._add_title_page(c)
+        # Persist probed dimensions and hashes for the next run
+        self._catalog.save(on_error=self._warn)
         
-        # Add images (2 per page)
-        total_pages = (len(images) + 1) // 2  # Round up
+        print()
+        print("=" * 60)
+        print(f"✅ PDF created successfully!")
+        print(f"📄 Output: {output_pdf}")
+        print(f"📊 Total pages: {total_pages + 1} (1 title + {total_pages} content)")
+        if self.max_size:
+            print(f"📦 Size: {format_size(os.path.getsize(output_pdf))} "
+                  f"(budget {format_size(self.max_size)})")
+        print("=" * 60)
+        
+        self._report('done', output=str(output_pdf), total_pages=total_pages)
+        return True
+    
+    def _write_pdf(self, images, output_pdf, total_pages):
+        """Render the document with the current settings"""
+        # Normalized buffers arrive in order from the preprocessing stage
+        if self.page_cache:
+            self._write_incremental(images, output_pdf, total_pages)
+        elif self.volumes is not None:
+            self._write_volumes(images, output_pdf, total_pages)
+        elif self.chunk_pages:
+            prepared = self._iter_prepared(images)
+            self._write_chunked(images, prepared, output_pdf, total_pages)
+        else:
+            prepared = self._iter_prepared(images)
+            
+            # Create PDF
+            c = canvas.Canvas(str(output_pdf), pagesize=self.page_size)
+            self._render_pages(c, images, prepared, 1, total_pages, total_pages)
+            
+            # Save PDF
+            c.save()
+    
+    def _report(self, event, **fields):
+        """Send a progress event to the create_pdf callback, if any"""
+        if self._progress is None:
+            return
         
-        for i in range(0, len(images), 2):
-            page_num = (i // 2) + 1
-            print(f"[{page_num}/{total_pages}] Adding page {page_num}...")
+        fields['event'] = event
+        fields['elapsed'] = time.perf_counter() - self._started
+        try:
+            self._progress(fields)
+        except Exception as e:
+            print(f"⚠️  Warning: Progress callback failed: {e}")
+    
+    def _stage(self, emoji, message):
+        """Print a stage message and report it as a progress event"""
+        print(f"{emoji} {message}")
+        self._report('stage', message=message)
+    
+    def _warn(self, message):
+        """Print a warning and report it as a progress event"""
+        print(f"⚠️  Warning: {message}")
+        self._report('warning', message=message)
+    
+    def _fit_size_budget(self, images, total_pages):
+        """
+        Pick JPEG quality and DPI so the PDF fits within max_size
+        
+        Sizes are estimated by encoding an evenly spaced sample of images and
+        scaling up, so the document itself is usually rendered once. The
+        requested settings are estimated as they would render (JPEGs may pass
+        through). Otherwise every image is re-encoded: JPEG quality is
+        binary-searched at the requested DPI; if even the lowest quality is
+        too large, the DPI is binary-searched at the lowest quality and the
+        quality searched again at that DPI. The search never goes above the
+        requested quality and DPI, nor below them when they are already under
+        MIN_BUDGET_QUALITY/MIN_BUDGET_DPI. Estimates are scaled by
+        _budget_correction, which _enforce_size_budget sets from a measured output.
+        """
+        requested_dpi, requested_format, requested_quality = self._requested
+        step = max(1, len(images) // SIZE_SAMPLE_COUNT)
+        sample = images[::step][:SIZE_SAMPLE_COUNT]
+        
+        limit = self.max_size * SIZE_BUDGET_MARGIN
+        
+        def estimate(dpi, quality, image_format='jpeg', passthrough=False):
+            key = dpi, quality, image_format, passthrough
+            if key not in self._size_estimates:
+                self._size_estimates[key] = self._estimate_pdf_size(
+                    sample, len(images), total_pages, dpi, quality, image_format, passthrough)
+            return self._size_estimates[key] * self._budget_correction
+        
+        # Requested settings may already fit
+        estimated = estimate(requested_dpi, requested_quality, requested_format, passthrough=True)
+        if estimated <= limit:
+            self.target_dpi, self.image_format, self.jpeg_quality = self._requested
+            self._passthrough = True
+            self._budget_estimate = estimated
+            print(f"🎯 Size budget {format_size(self.max_size)}: requested settings fit "
+                  f"(est. {format_size(estimated)})")
+            return
+        
+        dpi = requested_dpi or DEFAULT_BUDGET_DPI
+        min_quality = min(MIN_BUDGET_QUALITY, requested_quality)
+        min_dpi = min(MIN_BUDGET_DPI, dpi)
+        
+        quality = self._search_highest(min_quality, requested_quality,
+                                       lambda q: estimate(dpi, q) <= limit)
+        if quality is None:
+            dpi = self._search_highest(min_dpi, dpi, lambda d: estimate(d, min_quality) <= limit)
+            if dpi is None:
+                dpi, quality = min_dpi, min_quality
+            else:
+                # The lowest quality fits at this DPI; use the highest one that does
+                quality = self._search_highest(min_quality, requested_quality,
+                                               lambda q: estimate(dpi, q) <= limit)
+        
+        self.target_dpi, self.image_format, self.jpeg_quality = dpi, 'jpeg', quality
+        self._passthrough = False
+        self._budget_estimate = estimate(dpi, quality)
+        note = "" if self._budget_estimate <= limit else ", the lowest settings"
+        print(f"🎯 Size budget {format_size(self.max_size)}: {dpi} DPI, JPEG q{quality} "
+              f"(est. {format_size(self._budget_estimate)}{note})")
+    
+    def _enforce_size_budget(self, images, output_pdf, total_pages):
+        """
+        Re-render with tighter settings while the written PDF is over max_size
+        
+        Estimates come from a sample and can be off, so each retry first
+        scales them by how far the last one missed the measured size.
+        """
+        for _ in range(SIZE_BUDGET_RETRIES):
+            size = os.path.getsize(output_pdf)
+            if size <= self.max_size:
+                return
+            
+            settings = (self.target_dpi, self.image_format, self.jpeg_quality, self._passthrough)
+            self._budget_correction *= size / self._budget_estimate
+            self._stage("📦", f"{format_size(size)} is over the {format_size(self.max_size)} budget, "
+                              f"correcting the estimate by {size / self._budget_estimate:.2f}x")
+            self._fit_size_budget(images, total_pages)
+            if (self.target_dpi, self.image_format, self.jpeg_quality, self._passthrough) == settings:
+                break  # Already at the lowest settings
             
-            c.showPage()  # New page
+            self._report('start', images=len(images), total_pages=total_pages)
+            self._write_pdf(images, output_pdf, total_pages)
+        
+        size = os.path.getsize(output_pdf)
+        if size > self.max_size:
+            self._warn(f"Output is {format_size(size)}, over the {format_size(self.max_size)} budget")
+    
+    def _search_highest(self, low, high, fits):
+        """Binary search for the highest integer in [low, high] that fits, or None"""
+        best = None
+        while low <= high:
+            mid = (low + high) // 2
+            if fits(mid):
+                best, low = mid, mid + 1
+            else:
+                high = mid - 1
+        return best
+    
+    def _estimate_pdf_size(self, sample, image_count, total_pages, dpi, quality, image_format='jpeg',
+                           passthrough=False):
+        """Estimate the output size from the encoded size of sample images"""
+        box = self._image_box()
+        sample_bytes = 0
+        measured = 0
+        
+        for image_path in sample:
+            try:
+                prepared = prepare_image(image_path, box, dpi, image_format, quality, passthrough)
+            except Exception:
+                continue
+            if 'data' in prepared:
+                sample_bytes += len(prepared['data'])
+            else:
+                sample_bytes += os.path.getsize(prepared['path'])
+            measured += 1
+        
+        image_bytes = sample_bytes * image_count / max(measured, 1)
+        if rl_config.useA85:
+            image_bytes *= 1.25  # ASCII85 stores 4 bytes as 5 characters
+        
+        return image_bytes + total_pages * PAGE_OVERHEAD_BYTES + DOCUMENT_OVERHEAD_BYTES
+    
+    def _render_pages(self, c, images, prepared, first_page, last_page, total_pages):
+        """Render content pages first_page..last_page (1-based) onto a canvas
+        
+        The title page is added when the range starts at the first page.
+        """
+        if first_page == 1:
+            self._add_title_page(c)
+            c.showPage()
+        
+        # Static header/footer furniture, drawn once and referenced per page
+        self._define_page_chrome(c)
+        
+        for page_num in range(first_page, last_page + 1):
+            self._render_page(c, images, prepared, page_num, total_pages)
+    
+    def _render_page(self, c, images, prepared, page_num, total_pages):
+        """Render one content page; prepared yields the buffers for its images"""
+        i = (page_num - 1) * 2
+        start = time.perf_counter()
+        print(f"[{page_num}/{total_pages}] Adding page {page_num}...")
+        
+        # Add header with title
+        self._add_header(c, page_num, total_pages + 1)
+        
+        # Add first image (top)
+        if i < len(images):
+            self._add_image(c, images[i], position='top', prepared=next(prepared))
+        
+        # Add second image (bottom)
+        if i + 1 < len(images):
+            self._add_image(c, images[i + 1], position='bottom', prepared=next(prepared))
+        
+        # Add footer
+        self._add_footer(c, page_num + 1, total_pages + 1)
+        
+        c.showPage()  # Finish page
+        
+        # Includes waiting for the page's images from the preprocessing stage
+        self._report('page', page=page_num, total_pages=total_pages,
+                     seconds=time.perf_counter() - start, cached=False)
+    
+    def _write_chunked(self, images, prepared, output_pdf, total_pages):
+        """Write the PDF as fixed-size chunks on disk, then concatenate them"""
+        with tempfile.TemporaryDirectory(prefix='pdf_chunks_') as tmp_dir:
+            chunk_paths = []
             
-            # Add header with title
-            self._add_header(c, page_num, total_pages + 1)
+            for first_page in range(1, total_pages + 1, self.chunk_pages):
+                last_page = min(first_page + self.chunk_pages - 1, total_pages)
+                chunk_path = Path(tmp_dir) / f"chunk_{len(chunk_paths):05d}.pdf"
+                
+                # Each chunk gets its own canvas, released once it is saved
+                c = canvas.Canvas(str(chunk_path), pagesize=self.page_size)
+                self._render_pages(c, images, prepared, first_page, last_page, total_pages)
+                c.save()
+                del c
+                
+                chunk_paths.append(chunk_path)
+                print(f"💾 Wrote pages {first_page}-{last_page} to chunk {len(chunk_paths)}")
             
-            # Add first image (top)
-            if i < len(images):
-                self._add_image(c, images[i], position='top')
+            self._stage("🔗", f"Concatenating {len(chunk_paths)} chunks...")
+            self._merge_pdfs(chunk_paths, output_pdf)
+    
+    def _write_volumes(self, images, output_pdf, total_pages):
+        """Render contiguous page ranges in separate processes, then merge them"""
+        volume_count = min(self.volumes or os.cpu_count() or 1, total_pages)
+        pages_per_volume = -(-total_pages // volume_count)  # Round up
+        
+        ranges = [(first_page, min(first_page + pages_per_volume - 1, total_pages))
+                  for first_page in range(1, total_pages + 1, pages_per_volume)]
+        self._stage("📚", f"Rendering {len(ranges)} volumes in parallel...")
+        
+        with tempfile.TemporaryDirectory(prefix='pdf_volumes_') as tmp_dir:
+            volume_paths = [Path(tmp_dir) / f"volume_{n:03d}.pdf" for n in range(len(ranges))]
             
-            # Add second image (bottom)
-            if i + 1 < len(images):
-                self._add_image(c, images[i + 1], position='bottom')
+            with ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+                start = time.perf_counter()
+                futures = {
+                    executor.submit(self._render_volume, images, first_page, last_page,
+                                    total_pages, volume_path): (first_page, last_page)
+                    for (first_page, last_page), volume_path in zip(ranges, volume_paths)
+                }
+                
+                # Worker processes cannot call back, so a volume's pages and warnings
+                # are reported when it finishes
+                for future in as_completed(futures):
+                    for message in future.result():
+                        self._report('warning', message=message)
+                    first_page, last_page = futures[future]
+                    seconds = (time.perf_counter() - start) / (last_page - first_page + 1)
+                    for page_num in range(first_page, last_page + 1):
+                        self._report('page', page=page_num, total_pages=total_pages,
+                                     seconds=seconds, cached=False)
             
-            # Add footer
-            self._add_footer(c, page_num + 1, total_pages + 1)
+            self._stage("🔗", f"Merging {len(volume_paths)} volumes...")
+            self._merge_pdfs(volume_paths, output_pdf)
+    
+    def _render_volume(self, images, first_page, last_page, total_pages, volume_path):
+        """Render one page range to its own PDF (runs in a worker process); returns its warnings"""
+        # Volumes already use every core - prepare images inline in this process
+        if self.workers is not None:
+            self.workers = 1
+        
+        # Collect this process's events; the parent reports the warnings
+        events = []
+        self._progress = events.append
         
-        # Save PDF
+        prepared = self._iter_prepared(images[(first_page - 1) * 2:last_page * 2])
+        c = canvas.Canvas(str(volume_path), pagesize=self.page_size)
+        self._render_pages(c, images, prepared, first_page, last_page, total_pages)
         c.save()
+        return [event['message'] for event in events if event['event'] == 'warning']
+    
+    def _write_incremental(self, images, output_pdf, total_pages):
+        """Re-render only pages whose inputs changed, then reassemble the PDF
         
-        print()
-        print("=" * 60)
-        print(f"✅ PDF created successfully!")
-        print(f"📄 Output: {output_pdf}")
-        print(f"📊 Total pages: {total_pages + 1} (1 title + {total_pages} content)")
-        print("=" * 60)
+        Every page is cached as a single-page PDF named by a hash of its
+        inputs: image contents, labels, title, page size, position and
+        encoding settings. Unchanged pages are reused from the cache.
+        Several decks can share one cache folder; fragments are only pruned
+        once no deck's manifest references them.
+        """
+        self.page_cache.mkdir(parents=True, exist_ok=True)
         
-        return True
-    
-    def _find_images(self, folder):
-        """Find and sort images by number"""
-        folder = Path(folder)
+        # Title page fragment (the date is part of its content)
+        title_key = self._cache_key('title', self.additional_text,
+                                    datetime.now().strftime("%B %d, %Y"))
+        fragments = [(0, title_key)]
         
-        if not folder.exists():
-            return []
+        for page_num in range(1, total_pages + 1):
+            page_images = images[(page_num - 1) * 2:page_num * 2]
+            content = [[img.stem, self._catalog.content_hash(img)] for img in page_images]
+            fragments.append((page_num, self._cache_key('page', page_num, total_pages, content)))
         
-        # Find all image files
-        extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff']
-        all_images = []
+        stale = [(page_num, key) for page_num, key in fragments
+                 if not (self.page_cache / f"page_{key}.pdf").exists()]
+        print(f"♻️  Page cache: {len(fragments) - len(stale)} reused, {len(stale)} to render")
         
-        for ext in extensions:
-            all_images.extend(folder.glob(f'*{ext}'))
-            all_images.extend(folder.glob(f'*{ext.upper()}'))
+        stale_pages = {page_num for page_num, _ in stale}
+        for page_num, _ in fragments:
+            if page_num and page_num not in stale_pages:
+                self._report('page', page=page_num, total_pages=total_pages, seconds=0.0, cached=True)
         
-        # Sort by number in filename
-        def get_number(path):
-            # Extract number from filename
-            import re
-            numbers = re.findall(r'\d+', path.stem)
-            return int(numbers[0]) if numbers else 0
+        # Only the images on stale pages go through the preprocessing stage
+        stale_images = [img for page_num, _ in stale if page_num
+                        for img in images[(page_num - 1) * 2:page_num * 2]]
+        prepared = self._iter_prepared(stale_images)
         
-        sorted_images = sorted(all_images, key=get_number)
+        for page_num, key in stale:
+            fragment = self.page_cache / f"page_{key}.pdf"
+            tmp_fragment = fragment.with_suffix('.tmp')
+            
+            c = canvas.Canvas(str(tmp_fragment), pagesize=self.page_size)
+            if page_num == 0:
+                self._add_title_page(c)
+                c.showPage()
+            else:
+                self._define_page_chrome(c)
+                self._render_page(c, images, prepared, page_num, total_pages)
+            c.save()
+            
+            # Atomic rename: an interrupted build never leaves half a fragment
+            os.replace(tmp_fragment, fragment)
         
-        return sorted_images
+        self._stage("🔗", f"Assembling {len(fragments)} pages...")
+        self._merge_pdfs([self.page_cache / f"page_{key}.pdf" for _, key in fragments], output_pdf)
+        
+        self._prune_page_cache(output_pdf, [f"page_{key}.pdf" for _, key in fragments])
+    
+    def _prune_page_cache(self, output_pdf, fragment_names):
+        """Record this deck's fragments and delete fragments no deck uses any more
+        
+        Only page_<sha256>.pdf files are ever deleted, never the output or
+        other files kept in the folder. Manifests of decks whose output PDF
+        no longer exists are dropped along with their fragments.
+        """
+        output_pdf = Path(output_pdf).resolve()
+        deck_id = hashlib.sha256(str(output_pdf).encode('utf-8')).hexdigest()[:16]
+        manifest = self.page_cache / f"deck_{deck_id}.json"
+        
+        tmp_manifest = manifest.with_suffix('.tmp')
+        with open(tmp_manifest, 'w', encoding='utf-8') as f:
+            json.dump({'output': str(output_pdf), 'fragments': fragment_names}, f)
+        os.replace(tmp_manifest, manifest)
+        
+        keep = set()
+        for deck in self.page_cache.glob('deck_*.json'):
+            try:
+                with open(deck, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                deck_output, deck_fragments = data['output'], data['fragments']
+            except (OSError, ValueError, KeyError, TypeError):
+                return  # Unreadable manifest: keep every fragment rather than guess
+            
+            if deck != manifest and not Path(deck_output).exists():
+                deck.unlink()
+                continue
+            keep.update(deck_fragments)
+        
+        for fragment in self.page_cache.iterdir():
+            if (PAGE_FRAGMENT_RE.fullmatch(fragment.name) and fragment.name not in keep
+                    and fragment.resolve() != output_pdf):
+                fragment.unlink()
+    
+    def _cache_key(self, *parts):
+        """Hash page inputs together with the document-wide layout settings"""
+        layout = [PAGE_CACHE_VERSION, self.title, list(self.page_size), self.margin,
+                  self.target_dpi, self.image_format, self.jpeg_quality]
+        payload = json.dumps(layout + list(parts))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _merge_pdfs(self, pdf_paths, output_pdf):
+        """Concatenate PDF files into output_pdf, one source file in memory at a time"""
+        merger = PDFConcatenator(output_pdf)
+        for pdf_path in pdf_paths:
+            merger.append(pdf_path)
+        merger.close()
+    
+    def _find_images(self, folder):
+        """Find and sort images by number"""
+        # One directory pass; metadata is reused from the folder's sidecar index
+        self._catalog = ImageCatalog(folder)
+        return self._catalog.scan()
     
     def _add_title_page(self, c):
         """Add professional title page"""
@@ -143,68 +860,94 @@ class PDFGenerator:
         c.setFont("Helvetica", 12)
         c.drawCentredString(self.width / 2, 1.2 * inch, "Professional Study Material")
     
-    def _add_header(self, c, page_num, total_pages):
-        """Add header to page"""
+    def _define_page_chrome(self, c):
+        """Define the static header and footer as a reusable form XObject"""
+        c.beginForm(PAGE_CHROME_FORM)
+        
+        # Header title
         c.setFont("Helvetica-Bold", 14)
         c.setFillColor(colors.HexColor('#667eea'))
         c.drawString(self.margin, self.height - 0.5 * inch, self.title)
         
-        c.setFont("Helvetica", 10)
-        c.setFillColor(colors.grey)
-        c.drawRightString(self.width - self.margin, self.height - 0.5 * inch, 
-                         f"Page {page_num} of {total_pages}")
-        
         # Header line
         c.setStrokeColor(colors.HexColor('#667eea'))
         c.setLineWidth(1)
         c.line(self.margin, self.height - 0.6 * inch, 
                self.width - self.margin, self.height - 0.6 * inch)
-    
-    def _add_footer(self, c, page_num, total_pages):
-        """Add footer to page"""
-        c.setFont("Helvetica", 9)
-        c.setFillColor(colors.grey)
         
         # Footer line
         c.setStrokeColor(colors.lightgrey)
         c.setLineWidth(0.5)
         c.line(self.margin, 0.6 * inch, self.width - self.margin, 0.6 * inch)
         
+        c.endForm()
+    
+    def _add_header(self, c, page_num, total_pages):
+        """Add header to page"""
+        # Title and rule come from the shared form; only the counter is per page
+        c.doForm(PAGE_CHROME_FORM)
+        
+        c.setFont("Helvetica", 10)
+        c.setFillColor(colors.grey)
+        c.drawRightString(self.width - self.margin, self.height - 0.5 * inch, 
+                         f"Page {page_num} of {total_pages}")
+    
+    def _add_footer(self, c, page_num, total_pages):
+        """Add footer to page"""
+        # Footer line is part of the page chrome form drawn by _add_header
+        c.setFont("Helvetica", 9)
+        c.setFillColor(colors.grey)
+        
         # Page number
         c.drawCentredString(self.width / 2, 0.4 * inch, str(page_num))
     
-    def _add_image(self, c, image_path, position='top'):
-        """Add image to page"""
+    def _add_image(self, c, image_path, position='top', prepared=None):
+        """Add image to page
+        
+        prepared is the prepare_image() result for this image, an exception
+        raised while preparing it, or None to embed the original file.
+        """
         try:
-            # Open image to get dimensions
-            img = Image.open(image_path)
-            img_width, img_height = img.size
+            if isinstance(prepared, Exception):
+                raise prepared
+            
+            if not prepared:
+                # Dimensions come from the header only - no pixel decode
+                info = self._probe_image(image_path)
+                if can_passthrough(info, self._image_box()):
+                    prepared = passthrough_info(image_path, info['width'],
+                                                info['height'], info['mode'])
+                elif info['orientation'] != 1:
+                    # Rotated like prepare_image does, keeping the pixels lossless
+                    prepared = prepare_image(image_path, self._image_box())
+            
+            if prepared:
+                img_width, img_height = prepared['width'], prepared['height']
+            else:
+                img_width, img_height = info['width'], info['height']
             
             # Calculate available space
-            content_width = self.width - 2 * self.margin
+            content_width, content_height = self._image_box()
             
             if position == 'top':
-                content_height = (self.height - self.margin - 0.8 * inch - self.margin) / 2 - 0.2 * inch
                 y_position = self.height - 0.9 * inch - content_height
             else:  # bottom
-                content_height = (self.height - self.margin - 0.8 * inch - self.margin) / 2 - 0.2 * inch
                 y_position = self.margin + 0.5 * inch
             
             # Calculate scaling to fit
-            scale_w = content_width / img_width
-            scale_h = content_height / img_height
-            scale = min(scale_w, scale_h)
-            
-            new_width = img_width * scale * 0.95  # 95% to add padding
-            new_height = img_height * scale * 0.95
+            new_width, new_height = fit_image(img_width, img_height, content_width, content_height)
             
             # Center the image
             x_position = (self.width - new_width) / 2
             
             # Add image
-            c.drawImage(str(image_path), x_position, y_position - new_height, 
-                       width=new_width, height=new_height, 
-                       preserveAspectRatio=True, mask='auto')
+            if prepared:
+                self._draw_prepared(c, prepared, x_position, y_position - new_height,
+                                    new_width, new_height)
+            else:
+                c.drawImage(str(image_path), x_position, y_position - new_height, 
+                           width=new_width, height=new_height, 
+                           preserveAspectRatio=True, mask='auto')
             
             # Add image label
             c.setFont("Helvetica", 9)
@@ -213,7 +956,107 @@ class PDFGenerator:
             c.drawCentredString(self.width / 2, y_position - new_height - 0.2 * inch, label)
             
         except Exception as e:
-            print(f"⚠️  Warning: Could not add image {image_path.name}: {e}")
+            self._warn(f"Could not add image {image_path.name}: {e}")
+    
+    def _image_box(self):
+        """Size (width, height) of the area each of the two images is fitted into"""
+        content_width = self.width - 2 * self.margin
+        content_height = (self.height - self.margin - 0.8 * inch - self.margin) / 2 - 0.2 * inch
+        return content_width, content_height
+    
+    def _worker_count(self):
+        """Number of preprocessing processes to use"""
+        return self.workers or os.cpu_count() or 1
+    
+    def _iter_prepared(self, images):
+        """
+        Yield a prepare_image() result (or the exception it raised) per image, in order
+        
+        Without a target DPI or workers nothing needs normalizing and None is
+        yielded so the original files are embedded. With workers, images are
+        prepared in a process pool while the canvas consumes earlier results;
+        only a small window of buffers is in flight at any time.
+        """
+        if not self.target_dpi and self.workers is None:
+            for _ in images:
+                yield None
+            return
+        
+        options = (self._image_box(), self.target_dpi, self.image_format, self.jpeg_quality,
+                   self._passthrough)
+        worker_count = self._worker_count()
+        
+        if self.workers is None or worker_count == 1:
+            for image_path in images:
+                try:
+                    yield prepare_image(image_path, *options)
+                except Exception as e:
+                    yield e
+            return
+        
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            pending = deque()
+            remaining = iter(images)
+            
+            def submit_next():
+                image_path = next(remaining, None)
+                if image_path is not None:
+                    pending.append(executor.submit(prepare_image, image_path, *options))
+            
+            for _ in range(worker_count * 2):
+                submit_next()
+            
+            while pending:
+                future = pending.popleft()
+                submit_next()
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield e
+    
+    def _probe_image(self, image_path):
+        """Read image dimensions, mode and format from the file header (cached)"""
+        return self._catalog.image_info(image_path)
+    
+    def _draw_prepared(self, c, prepared, x, y, width, height):
+        """Embed a prepare_image() buffer as an image XObject without decoding it"""
+        # drawImage would decode an ImageReader just to name the XObject,
+        # so register the image under a digest of the encoded bytes instead.
+        # Passthrough JPEGs are read from disk as-is and embedded as DCT streams.
+        data = prepared.get('data')
+        if data is None:
+            data = Path(prepared['path']).read_bytes()
+        name = hashlib.md5(data).hexdigest()
+        reg_name = c._doc.getXObjectName(name)
+        
+        if not c._doc.idToObject.get(reg_name):
+            img_obj = pdfdoc.PDFImageXObject(name)
+            if prepared['format'] == 'jpeg':
+                if not img_obj.loadImageFromJPEG(BytesIO(data)):
+                    raise ValueError("invalid JPEG stream")
+            else:
+                img_obj.width, img_obj.height = prepared['width'], prepared['height']
+                img_obj.bitsPerComponent = 8
+                img_obj.colorSpace = prepared['color_space']
+                img_obj.mask = None
+                if rl_config.useA85:
+                    img_obj.streamContent = pdfdoc.asciiBase85Encode(data)
+                    img_obj._filters = 'ASCII85Decode', 'FlateDecode'
+                else:
+                    img_obj.streamContent = data
+                    img_obj._filters = 'FlateDecode',
+            img_obj.name = name
+            c._setXObjects(img_obj)
+            c._doc.Reference(img_obj, reg_name)
+            c._doc.addForm(name, img_obj)
+        
+        c.saveState()
+        c.translate(x, y)
+        c.scale(width, height)
+        c._code.append(f"/{reg_name} Do")
+        c.restoreState()
+        c._formsinuse.append(name)
+        c._currentPageHasImages = 1
 
 
 def main():
@@ -225,6 +1068,22 @@ def main():
     parser.add_argument('-a', '--additional-text', default='', help='Additional text for title page')
     parser.add_argument('--letter', action='store_true', help='Use Letter size (default)')
     parser.add_argument('--a4', action='store_true', help='Use A4 size')
+    parser.add_argument('--dpi', type=int, default=None,
+                        help='Downsample images to this DPI at their printed size (e.g. 150)')
+    parser.add_argument('--image-format', default='jpeg', choices=IMAGE_FORMATS,
+                        help='Re-encoding for resampled images (default: jpeg)')
+    parser.add_argument('--jpeg-quality', type=int, default=85,
+                        help='JPEG quality for resampled images, 1-95 (default: 85)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Preprocess images in N worker processes (0 = one per CPU core)')
+    parser.add_argument('--chunk-pages', type=int, default=None,
+                        help='Stream very large decks in chunks of N pages (e.g. 200) to bound memory')
+    parser.add_argument('--page-cache', default=None,
+                        help='Cache rendered pages in this folder and only re-render changed pages')
+    parser.add_argument('--volumes', type=int, default=None,
+                        help='Render N page ranges in parallel processes and merge (0 = one per CPU core)')
+    parser.add_argument('--max-size', type=parse_size, default=None,
+                        help='Keep the PDF under this size, e.g. 25MB (picks DPI and JPEG quality)')
     
     args = parser.parse_args()
     
@@ -235,7 +1094,15 @@ def main():
     generator = PDFGenerator(
         title=args.title,
         additional_text=args.additional_text,
-        page_size=page_size
+        page_size=page_size,
+        target_dpi=args.dpi,
+        image_format=args.image_format,
+        jpeg_quality=args.jpeg_quality,
+        workers=args.workers,
+        chunk_pages=args.chunk_pages,
+        page_cache=args.page_cache,
+        volumes=args.volumes,
+        max_size=args.max_size
     )
     
     # Generate PDF
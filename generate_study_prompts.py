@@ -5,37 +5,278 @@ Reads medical exam PDFs and generates enriched study prompts using AI + First Ai
 
 import os
 import re
-import csv
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
 from pathlib import Path
 from typing import List, Dict
 import PyPDF2
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+from file_hash import file_sha256
 
 # Load environment variables
 load_dotenv()
 
+# Returned when an API call fails; results containing these should not be cached
+FALLBACK_CONCEPTS = "Unknown concepts"
+
+
+def fallback_prompt(question_num: int) -> str:
+    """Generic prompt used when prompt generation fails"""
+    return f"Professionally condense and explain the concepts in question {question_num}."
+
+
+# Instrumentation hooks, called as hook(event, **fields) for:
+#   'api_call'        stage, seconds, prompt_tokens, completion_tokens, error
+#   'api_cancelled'   stage, seconds (a request abandoned by a cancel; not an error)
+#   'firstaid_lookup' hit
+_instrumentation_hooks = []
+
+
+def add_instrumentation_hook(hook) -> None:
+    """Register a callable that receives generator events (e.g. for metrics)"""
+    _instrumentation_hooks.append(hook)
+
+
+def remove_instrumentation_hook(hook) -> None:
+    """Unregister a hook added with add_instrumentation_hook"""
+    if hook in _instrumentation_hooks:
+        _instrumentation_hooks.remove(hook)
+
+
+def _emit(event: str, **fields) -> None:
+    """Send an event to every hook; a failing hook never breaks generation"""
+    for hook in list(_instrumentation_hooks):
+        try:
+            hook(event, **fields)
+        except Exception as e:
+            print(f"Warning: Instrumentation hook failed: {e}")
+
+
+def _emit_api_call(stage: str, start: float, response) -> None:
+    """Report a finished chat request (response is None if it failed)"""
+    usage = getattr(response, 'usage', None)
+    _emit('api_call',
+          stage=stage,
+          seconds=time.perf_counter() - start,
+          prompt_tokens=usage.prompt_tokens if usage else 0,
+          completion_tokens=usage.completion_tokens if usage else 0,
+          error=response is None)
+
+
+class GenerationCancelled(BaseException):
+    """
+    Raised in a generation whose CancellationToken was cancelled
+    
+    Like asyncio.CancelledError it is not an Exception, so the fallbacks
+    around API calls do not turn a cancel into a generic prompt.
+    """
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation shared by a front end and a running generation
+    
+    The worker checks the token between stages. Requests made through
+    run() return as soon as the token is cancelled instead of waiting for
+    the API to answer.
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def cancel(self) -> None:
+        """Cancel and run the on_cancel callbacks (from any thread)"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Warning: Cancellation callback failed: {e}")
+    
+    def on_cancel(self, callback) -> None:
+        """Call callback when the token is cancelled (right away if it already is)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+    
+    def remove_callback(self, callback) -> None:
+        """Unregister a callback added with on_cancel"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+    
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise GenerationCancelled()
+    
+    def run(self, func, *args, **kwargs):
+        """
+        Call func on a helper thread and return its result
+        
+        Raises GenerationCancelled as soon as the token is cancelled. A
+        blocking HTTP read cannot be interrupted from another thread, so the
+        abandoned call finishes in the background and its result is dropped.
+        """
+        self.raise_if_cancelled()
+        
+        future = Future()
+        
+        def call():
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+        
+        done = threading.Event()
+        future.add_done_callback(lambda f: done.set())
+        self.on_cancel(done.set)
+        try:
+            threading.Thread(target=call, name='cancellable-request', daemon=True).start()
+            done.wait()
+        finally:
+            self.remove_callback(done.set)
+        
+        if not future.done():
+            raise GenerationCancelled()
+        return future.result()
+
+
+class FirstAidIndex:
+    """Extracted First Aid text plus the line structures used for retrieval (read-only)"""
+    
+    def __init__(self, text: str, sha256: str = None):
+        self.text = text
+        self.sha256 = sha256
+        self.lines = text.split('\n')
+        self.lines_lower = [line.lower() for line in self.lines]
+
+
+# Process-wide First Aid registry, shared by every generator and thread.
+# Entries are keyed by resolved path and validated by (mtime, size); when
+# those change the file is re-hashed, and the text is only re-extracted if
+# the content hash changed. Books with identical content share one index.
+_firstaid_by_path = {}
+_firstaid_by_hash = {}
+_firstaid_locks = {}
+_firstaid_registry_lock = threading.Lock()
+
+
+def load_firstaid_index(pdf_path: str) -> FirstAidIndex:
+    """Return the First Aid index for a PDF, extracting it only on first use or after a change"""
+    path = Path(pdf_path).resolve()
+    
+    with _firstaid_registry_lock:
+        path_lock = _firstaid_locks.setdefault(path, threading.Lock())
+    
+    # Threads asking for the same book wait for a single extraction
+    with path_lock:
+        try:
+            stat = path.stat()
+            fingerprint = (stat.st_mtime_ns, stat.st_size)
+            
+            cached = _firstaid_by_path.get(path)
+            if cached and cached[0] == fingerprint:
+                _emit('firstaid_lookup', hit=True)
+                return cached[1]
+            
+            sha256 = file_sha256(path)
+            index = _firstaid_by_hash.get(sha256)
+            _emit('firstaid_lookup', hit=index is not None)
+            if index is None:
+                print(f"Loading First Aid reference from: {pdf_path}")
+                with open(path, 'rb') as file:
+                    reader = PyPDF2.PdfReader(file)
+                    text = ""
+                    for page in reader.pages:
+                        text += page.extract_text() + "\n"
+                print(f"✓ Loaded {len(text)} characters from First Aid")
+                index = FirstAidIndex(text, sha256)
+            
+            with _firstaid_registry_lock:
+                if cached and cached[1].sha256 != sha256:
+                    _firstaid_by_hash.pop(cached[1].sha256, None)
+                _firstaid_by_hash[sha256] = index
+                _firstaid_by_path[path] = (fingerprint, index)
+            return index
+        except Exception as e:
+            # Not cached, so a fixed file is picked up on the next call
+            print(f"Warning: Could not load First Aid PDF: {e}")
+            return FirstAidIndex("")
+
+
+def preload_firstaid(pdf_paths) -> None:
+    """Warm the First Aid registry, e.g. at server start"""
+    for pdf_path in pdf_paths:
+        if Path(pdf_path).exists():
+            load_firstaid_index(pdf_path)
+
 
 class MedicalPromptGenerator:
-    def __init__(self, firstaid_pdf_path: str):
+    def __init__(self, firstaid_pdf_path: str, cancel_token: CancellationToken = None):
         """Initialize with First Aid PDF as knowledge base"""
         self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-        self.firstaid_content = self._load_firstaid(firstaid_pdf_path)
+        self.cancel_token = cancel_token or CancellationToken()
+        self._async_client = None
+        self.firstaid_index = load_firstaid_index(firstaid_pdf_path)
+        self.firstaid_content = self.firstaid_index.text
+    
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Async OpenAI client, created on first use (for the ASGI server)"""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        return self._async_client
+    
+    def _chat(self, stage: str, **kwargs):
+        """
+        Chat completion request, reported to instrumentation hooks as an 'api_call' event
+        (or 'api_cancelled' when a cancel abandons it)
         
-    def _load_firstaid(self, pdf_path: str) -> str:
-        """Load and extract text from First Aid PDF"""
-        print(f"Loading First Aid reference from: {pdf_path}")
+        Raises GenerationCancelled as soon as the cancel token is cancelled.
+        """
+        self.cancel_token.raise_if_cancelled()
+        start = time.perf_counter()
         try:
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            print(f"✓ Loaded {len(text)} characters from First Aid")
-            return text
-        except Exception as e:
-            print(f"Warning: Could not load First Aid PDF: {e}")
-            return ""
+            response = self.cancel_token.run(self.client.chat.completions.create, **kwargs)
+        except GenerationCancelled:
+            _emit('api_cancelled', stage=stage, seconds=time.perf_counter() - start)
+            raise
+        except BaseException:
+            _emit_api_call(stage, start, None)
+            raise
+        _emit_api_call(stage, start, response)
+        return response
+    
+    async def _achat(self, stage: str, **kwargs):
+        """_chat on the async client (cancel by cancelling the awaiting task)"""
+        self.cancel_token.raise_if_cancelled()
+        start = time.perf_counter()
+        try:
+            response = await self.async_client.chat.completions.create(**kwargs)
+        except (GenerationCancelled, asyncio.CancelledError):
+            _emit('api_cancelled', stage=stage, seconds=time.perf_counter() - start)
+            raise
+        except BaseException:
+            _emit_api_call(stage, start, None)
+            raise
+        _emit_api_call(stage, start, response)
+        return response
     
     def extract_questions_from_pdf(self, pdf_path: str) -> List[Dict]:
         """Extract individual questions from exam PDF"""
@@ -120,7 +361,25 @@ class MedicalPromptGenerator:
     
     def identify_key_concepts(self, question_text: str) -> str:
         """Use AI to identify key medical concepts in the question"""
-        
+        try:
+            response = self._chat('concepts', **self._concepts_request(question_text))
+            concepts = response.choices[0].message.content.strip()
+            return concepts
+        except Exception as e:
+            print(f"Error identifying concepts: {e}")
+            return FALLBACK_CONCEPTS
+    
+    async def aidentify_key_concepts(self, question_text: str) -> str:
+        """identify_key_concepts on the async client"""
+        try:
+            response = await self._achat('concepts', **self._concepts_request(question_text))
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error identifying concepts: {e}")
+            return FALLBACK_CONCEPTS
+    
+    def _concepts_request(self, question_text: str) -> Dict:
+        """Chat request for identifying the key concepts of a question"""
         prompt = f"""Analyze this medical exam question and identify the KEY MEDICAL CONCEPTS being tested.
 List the main topics, diseases, mechanisms, or clinical findings that are central to this question.
 
@@ -129,26 +388,36 @@ Question:
 
 Return ONLY a concise list of key concepts (3-7 items), separated by semicolons."""
 
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a medical education expert analyzing USMLE-style questions."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,
-                max_tokens=300
-            )
-            
-            concepts = response.choices[0].message.content.strip()
-            return concepts
-        except Exception as e:
-            print(f"Error identifying concepts: {e}")
-            return "Unknown concepts"
+        return dict(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a medical education expert analyzing USMLE-style questions."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.3,
+            max_tokens=300
+        )
     
     def generate_enriched_prompt(self, question_num: int, question_text: str, concepts: str) -> str:
         """Generate enriched study prompt using AI + First Aid"""
-        
+        try:
+            response = self._chat('prompt', **self._prompt_request(question_num, question_text, concepts))
+            return self._clean_prompt(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Error generating prompt for Q{question_num}: {e}")
+            return fallback_prompt(question_num)
+    
+    async def agenerate_enriched_prompt(self, question_num: int, question_text: str, concepts: str) -> str:
+        """generate_enriched_prompt on the async client"""
+        try:
+            response = await self._achat('prompt', **self._prompt_request(question_num, question_text, concepts))
+            return self._clean_prompt(response.choices[0].message.content)
+        except Exception as e:
+            print(f"Error generating prompt for Q{question_num}: {e}")
+            return fallback_prompt(question_num)
+    
+    def _prompt_request(self, question_num: int, question_text: str, concepts: str) -> Dict:
+        """Chat request for the enriched study prompt of a question"""
         # Find relevant First Aid sections
         firstaid_excerpt = self._find_relevant_firstaid_section(concepts)
         
@@ -174,28 +443,26 @@ Generate a SINGLE, comprehensive study prompt that:
 
 Return ONLY the prompt text, no additional commentary."""
 
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a medical educator creating high-yield study materials."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.4,
-                max_tokens=500
-            )
-            
-            enriched_prompt = response.choices[0].message.content.strip()
-            
-            # Clean up the prompt
-            enriched_prompt = enriched_prompt.replace('"', '').strip()
-            if not enriched_prompt.startswith("Professionally"):
-                enriched_prompt = "Professionally condense and explain " + enriched_prompt
-            
-            return enriched_prompt
-        except Exception as e:
-            print(f"Error generating prompt for Q{question_num}: {e}")
-            return f"Professionally condense and explain the concepts in question {question_num}."
+        return dict(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a medical educator creating high-yield study materials."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.4,
+            max_tokens=500
+        )
+    
+    def _clean_prompt(self, text: str) -> str:
+        """Normalize a generated prompt"""
+        enriched_prompt = text.strip()
+        
+        # Clean up the prompt
+        enriched_prompt = enriched_prompt.replace('"', '').strip()
+        if not enriched_prompt.startswith("Professionally"):
+            enriched_prompt = "Professionally condense and explain " + enriched_prompt
+        
+        return enriched_prompt
     
     def _find_relevant_firstaid_section(self, concepts: str) -> str:
         """Find relevant sections in First Aid based on concepts"""
@@ -205,11 +472,10 @@ Return ONLY the prompt text, no additional commentary."""
         # Simple keyword matching - find paragraphs containing concept keywords
         keywords = [k.strip().lower() for k in concepts.split(';')]
         
-        lines = self.firstaid_content.split('\n')
+        lines = self.firstaid_index.lines
         relevant_sections = []
         
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
+        for i, line_lower in enumerate(self.firstaid_index.lines_lower):
             if any(keyword in line_lower for keyword in keywords if len(keyword) > 3):
                 # Get context around the matching line
                 start = max(0, i - 5)
@@ -232,47 +498,15 @@ Return ONLY the prompt text, no additional commentary."""
             print("❌ No questions found. Please check the PDF format.")
             return
         
-        # Process each question
-        results = []
+        # Process each question (PIPELINE_WORKERS at once) and write the CSV
+        from pipeline import Pipeline, CSVSink, print_progress
+        outcome = Pipeline(self, sinks=[CSVSink(output_csv_path)], hooks=[print_progress]).run(questions)
         
-        for i, q in enumerate(questions, 1):
-            print(f"\n[{i}/{len(questions)}] Processing Question {q['number']}...")
-            
-            # Identify concepts
-            print(f"  → Identifying key concepts...")
-            concepts = self.identify_key_concepts(q['content'])
-            print(f"  → Concepts: {concepts[:100]}...")
-            
-            # Generate enriched prompt
-            print(f"  → Generating enriched prompt...")
-            enriched_prompt = self.generate_enriched_prompt(
-                q['number'], 
-                q['content'], 
-                concepts
-            )
-            
-            results.append({
-                'question_number': q['number'],
-                'prompt': enriched_prompt
-            })
-            
-            print(f"  ✓ Complete")
-        
-        # Sort by question number
-        results.sort(key=lambda x: x['question_number'])
-        
-        # Write to CSV
         print(f"\n{'=' * 60}")
-        print(f"Writing results to: {output_csv_path}")
-        
-        with open(output_csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Question Number', 'Prompt'])
-            
-            for result in results:
-                writer.writerow([result['question_number'], result['prompt']])
-        
-        print(f"✓ Successfully generated {len(results)} study prompts!")
+        if outcome['status'] == 'cancelled':
+            # Completed prompts are still written
+            print(f"⏹️  Cancelled after {outcome['completed']} of {len(questions)} questions")
+        print(f"✓ Successfully generated {outcome['completed']} study prompts!")
         print(f"✓ Output saved to: {output_csv_path}")
         print("=" * 60)
 
@@ -6,15 +6,53 @@ User-friendly interface for generating enriched study prompts
 
 import os
 import sys
+import time
+import queue
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
 import threading
 from dotenv import load_dotenv, set_key
-from generate_study_prompts import MedicalPromptGenerator
+from generate_study_prompts import MedicalPromptGenerator, CancellationToken
+from pipeline import Pipeline, Sink, CSVSink
+from pdf_catalog import get_catalog
+from tk_ui_queue import UIQueueMixin, UI_REFRESH_MS
 
 
-class StudyPromptGeneratorGUI:
+class TkSink(Sink):
+    """Sends pipeline progress to the GUI's status log and progress bar (from the worker thread)"""
+    
+    def __init__(self, gui):
+        self.gui = gui
+        self.done = 0
+    
+    def event(self, name, **fields):
+        gui = self.gui
+        
+        if name == 'start':
+            gui._report_progress(0, fields['total'])
+        
+        elif name == 'question' and not fields['cached']:
+            gui._log_status(f"[{fields['index']}/{fields['total']}] Processing Question {fields['number']}...")
+        
+        elif name == 'stage' and fields['stage'] == 'concepts':
+            gui._log_status(f"  → Identifying key concepts...")
+        
+        elif name == 'concepts':
+            gui._log_status(f"  → Concepts: {fields['concepts'][:100]}...")
+        
+        elif name == 'stage' and fields['stage'] == 'prompt':
+            gui._log_status(f"  → Generating enriched prompt...")
+        
+        elif name == 'result':
+            # Results can finish out of order, so progress counts them
+            self.done += 1
+            gui._log_status(f"  ✓ Complete")
+            gui._log_status("")
+            gui._report_progress(self.done, fields['total'])
+
+
+class StudyPromptGeneratorGUI(UIQueueMixin):
     def __init__(self, root):
         self.root = root
         self.root.title("Medical Study Prompt Generator")
@@ -32,6 +70,9 @@ class StudyPromptGeneratorGUI:
         self.input_nature = tk.StringVar(value="An NBME exam of 50 questions with some explanations that needs to be enriched by firstaid and made into prompts")
         self.num_questions = tk.StringVar(value="50")
         self.api_key_var = tk.StringVar(value=self.api_key if self.api_key else "")
+        self.cancel_token = None
+        self.ui_queue = queue.Queue()
+        self.progress_started = None
         
         # Auto-detect PDFs
         self._auto_detect_pdfs()
@@ -39,6 +80,9 @@ class StudyPromptGeneratorGUI:
         # Build UI
         self._build_ui()
         
+        # Apply UI updates queued by the worker thread
+        self.root.after(UI_REFRESH_MS, self._drain_ui_queue)
+        
         # Check API key on startup
         if not self.api_key:
             self._show_api_key_dialog()
@@ -46,22 +90,21 @@ class StudyPromptGeneratorGUI:
     def _auto_detect_pdfs(self):
         """Auto-detect PDF files in current directory"""
         current_dir = Path.cwd()
+        catalog = get_catalog(current_dir)
         
         # Look for first aid PDF
-        for name in ['first aid.pdf', 'firstaid.pdf', 'First Aid.pdf']:
-            if (current_dir / name).exists():
-                self.firstaid_pdf_path.set(str(current_dir / name))
-                break
+        firstaid = catalog.firstaid_pdf()
+        if firstaid:
+            self.firstaid_pdf_path.set(str(firstaid))
         
         # Look for input PDF
-        for pdf in current_dir.glob('*.pdf'):
-            if pdf.name.lower() not in ['first aid.pdf', 'firstaid.pdf']:
-                if 'nbme' in pdf.name.lower() or 'input' in pdf.name.lower():
-                    self.input_pdf_path.set(str(pdf))
-                    # Auto-set output name
-                    output_name = pdf.stem + "_study_prompts.csv"
-                    self.output_csv_path.set(str(current_dir / output_name))
-                    break
+        for pdf in catalog.exam_pdfs():
+            if 'nbme' in pdf.name.lower() or 'input' in pdf.name.lower():
+                self.input_pdf_path.set(str(pdf))
+                # Auto-set output name
+                output_name = pdf.stem + "_study_prompts.csv"
+                self.output_csv_path.set(str(current_dir / output_name))
+                break
     
     def _build_ui(self):
         """Build the main user interface"""
@@ -168,8 +211,11 @@ class StudyPromptGeneratorGUI:
         progress_frame = tk.LabelFrame(main_frame, text="📊 Progress", font=("Helvetica", 12, "bold"), padx=10, pady=10)
         progress_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 15))
         
-        self.progress_bar = ttk.Progressbar(progress_frame, mode='indeterminate')
-        self.progress_bar.pack(fill=tk.X, pady=(0, 10))
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate')
+        self.progress_bar.pack(fill=tk.X, pady=(0, 5))
+        
+        self.progress_label = tk.Label(progress_frame, text="", font=("Helvetica", 9), fg="gray")
+        self.progress_label.pack(anchor=tk.W, pady=(0, 10))
         
         self.status_text = scrolledtext.ScrolledText(
             progress_frame,
@@ -192,6 +238,19 @@ class StudyPromptGeneratorGUI:
             cursor="hand2"
         )
         self.generate_btn.pack(fill=tk.X)
+        
+        # Cancel Button (enabled while generating)
+        self.cancel_btn = tk.Button(
+            main_frame,
+            text="⏹️ Cancel",
+            command=self._cancel_generation,
+            bg="#e74c3c",
+            fg="white",
+            font=("Helvetica", 11, "bold"),
+            state=tk.DISABLED,
+            cursor="hand2"
+        )
+        self.cancel_btn.pack(fill=tk.X, pady=(5, 0))
     
     def _add_file_selector(self, parent, label_text, var, button_text):
         """Add a file selector row"""
@@ -330,10 +389,33 @@ class StudyPromptGeneratorGUI:
         key_entry.focus()
     
     def _log_status(self, message):
-        """Add message to status text area"""
-        self.status_text.insert(tk.END, message + "\n")
-        self.status_text.see(tk.END)
-        self.root.update_idletasks()
+        """Add message to status text area (safe from any thread)"""
+        self.ui_queue.put(('log', message))
+    
+    def _report_progress(self, done, total):
+        """Update the progress bar (safe from any thread)"""
+        self.ui_queue.put(('progress', (done, total, time.monotonic())))
+    
+    def _show_progress(self, updates):
+        """Progress bar value plus throughput and ETA for the latest update"""
+        for done, total, timestamp in updates:
+            if done == 0:
+                self.progress_started = timestamp
+        
+        done, total, timestamp = updates[-1]
+        self.progress_bar.config(maximum=max(total, 1), value=done)
+        
+        if done == 0 or self.progress_started is None:
+            self.progress_label.config(text=f"{done}/{total} questions")
+            return
+        
+        elapsed = timestamp - self.progress_started
+        rate = done / elapsed if elapsed > 0 else 0
+        text = f"{done}/{total} questions • {rate * 60:.1f} per minute"
+        if rate and done < total:
+            remaining = int((total - done) / rate)
+            text += f" • ETA {remaining // 60}m {remaining % 60:02d}s"
+        self.progress_label.config(text=text)
     
     def _validate_inputs(self):
         """Validate all inputs before generation"""
@@ -365,20 +447,30 @@ class StudyPromptGeneratorGUI:
         
         # Disable button
         self.generate_btn.config(state=tk.DISABLED, text="⏳ Generating...")
-        self.progress_bar.start(10)
+        self.cancel_btn.config(state=tk.NORMAL, text="⏹️ Cancel")
+        self.cancel_token = CancellationToken()
+        self.progress_bar.config(value=0)
+        self.progress_label.config(text="")
+        self.progress_started = None
         self.status_text.delete(1.0, tk.END)
         
+        # Tk variables are read here on the UI thread, never from the worker
+        args = (self.input_pdf_path.get(), self.firstaid_pdf_path.get(),
+                self.output_csv_path.get(), self.cancel_token)
+        
         # Run in background thread
-        thread = threading.Thread(target=self._run_generation, daemon=True)
+        thread = threading.Thread(target=self._run_generation, args=args, daemon=True)
         thread.start()
     
-    def _run_generation(self):
-        """Run the actual generation process"""
+    def _cancel_generation(self):
+        """Stop the running generation after the current request; finished prompts are saved"""
+        if self.cancel_token:
+            self.cancel_token.cancel()
+            self.cancel_btn.config(state=tk.DISABLED, text="⏳ Cancelling...")
+    
+    def _run_generation(self, input_pdf, firstaid_pdf, output_csv, token):
+        """Run the actual generation process (worker thread; no Tk calls)"""
         try:
-            input_pdf = self.input_pdf_path.get()
-            firstaid_pdf = self.firstaid_pdf_path.get()
-            output_csv = self.output_csv_path.get()
-            
             self._log_status("=" * 60)
             self._log_status("Medical Study Prompt Generator")
             self._log_status("=" * 60)
@@ -386,7 +478,7 @@ class StudyPromptGeneratorGUI:
             
             # Initialize generator
             self._log_status(f"Loading First Aid reference from: {Path(firstaid_pdf).name}")
-            generator = MedicalPromptGenerator(firstaid_pdf)
+            generator = MedicalPromptGenerator(firstaid_pdf, cancel_token=token)
             self._log_status(f"✓ Loaded {len(generator.firstaid_content)} characters from First Aid")
             self._log_status("")
             
@@ -396,59 +488,39 @@ class StudyPromptGeneratorGUI:
             self._log_status(f"✓ Extracted {len(questions)} questions")
             self._log_status("")
             
-            # Process each question
-            results = []
-            for i, q in enumerate(questions, 1):
-                self._log_status(f"[{i}/{len(questions)}] Processing Question {q['number']}...")
-                
-                # Identify concepts
-                self._log_status(f"  → Identifying key concepts...")
-                concepts = generator.identify_key_concepts(q['content'])
-                self._log_status(f"  → Concepts: {concepts[:100]}...")
-                
-                # Generate prompt
-                self._log_status(f"  → Generating enriched prompt...")
-                prompt = generator.generate_enriched_prompt(q['number'], q['content'], concepts)
-                
-                results.append({
-                    'question_number': q['number'],
-                    'prompt': prompt
-                })
-                
-                self._log_status(f"  ✓ Complete")
-                self._log_status("")
-            
-            # Sort and save
-            results.sort(key=lambda x: x['question_number'])
-            
-            import csv
-            with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['Question Number', 'Prompt'])
-                for result in results:
-                    writer.writerow([result['question_number'], result['prompt']])
+            # Process each question and write the CSV (finished prompts are kept on cancel)
+            outcome = Pipeline(generator, sinks=[TkSink(self), CSVSink(output_csv)]).run(questions)
+            completed = outcome['completed']
             
+            if outcome['status'] == 'cancelled':
+                self._log_status(f"⏹️ Cancelled after {completed} completed prompts")
             self._log_status("=" * 60)
-            self._log_status(f"✓ Successfully generated {len(results)} study prompts!")
+            self._log_status(f"✓ Successfully generated {completed} study prompts!")
             self._log_status(f"✓ Output saved to: {output_csv}")
             self._log_status("=" * 60)
             
-            # Show success dialog
-            self.root.after(0, lambda: messagebox.showinfo(
-                "Success!",
-                f"Successfully generated {len(results)} study prompts!\n\nSaved to:\n{output_csv}"
-            ))
+            if outcome['status'] == 'cancelled':
+                self._call_in_ui(lambda: messagebox.showinfo(
+                    "Cancelled",
+                    f"Generation cancelled. {completed} completed prompts were saved to:\n{output_csv}"
+                ))
+            else:
+                self._call_in_ui(lambda: messagebox.showinfo(
+                    "Success!",
+                    f"Successfully generated {completed} study prompts!\n\nSaved to:\n{output_csv}"
+                ))
             
         except Exception as e:
             self._log_status(f"\n❌ Error: {str(e)}")
             import traceback
             self._log_status(traceback.format_exc())
-            self.root.after(0, lambda: messagebox.showerror("Error", f"An error occurred:\n{str(e)}"))
+            error = str(e)
+            self._call_in_ui(lambda: messagebox.showerror("Error", f"An error occurred:\n{error}"))
         
         finally:
-            # Re-enable button
-            self.root.after(0, lambda: self.progress_bar.stop())
-            self.root.after(0, lambda: self.generate_btn.config(state=tk.NORMAL, text="🚀 Generate Study Prompts"))
+            # Re-enable buttons
+            self._call_in_ui(lambda: self.generate_btn.config(state=tk.NORMAL, text="🚀 Generate Study Prompts"))
+            self._call_in_ui(lambda: self.cancel_btn.config(state=tk.DISABLED, text="⏹️ Cancel"))
 
 
 def main():
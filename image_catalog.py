@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Image Catalog
+Single-pass scan of an image folder with a persistent sidecar metadata index
+"""
+
+import os
+import re
+import json
+import hashlib
+from pathlib import Path
+from PIL import Image
+from file_hash import file_sha256
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff'}
+INDEX_NAME = '.image_index.json'
+INDEX_VERSION = 1
+EXIF_ORIENTATION = 0x0112
+
+_NUMBER_RE = re.compile(r'\d+')
+_NATURAL_SPLIT_RE = re.compile(r'(\d+)')
+
+
+def natural_sort_key(path):
+    """
+    Sort key for numbered image files
+
+    Primary key is the first number in the file name (so 2.png comes before
+    10.png); ties are broken by a natural comparison of the whole name.
+    """
+    stem = path.stem
+    match = _NUMBER_RE.search(stem)
+    first_number = int(match.group()) if match else 0
+    parts = [int(part) if part.isdigit() else part.lower()
+             for part in _NATURAL_SPLIT_RE.split(stem)]
+    return first_number, parts
+
+
+def image_header(img):
+    """Width, height, mode, format and EXIF orientation of an opened image (no pixel decode)"""
+    return {
+        'width': img.width,
+        'height': img.height,
+        'mode': img.mode,
+        'format': img.format,
+        'orientation': img.getexif().get(EXIF_ORIENTATION, 1)
+    }
+
+
+class ImageCatalog:
+    """
+    Catalog of the images in one folder
+
+    The folder is listed with a single os.scandir pass. Per-file metadata
+    (size, mtime, image_header fields, SHA-256) is stored in a sidecar
+    index inside the folder and reused while a file's size and mtime are
+    unchanged, so later PDF and Gemini runs skip header reads and hashing.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.index_path = self.folder / INDEX_NAME
+        self._entries = self._load_index()
+        self._dirty = False
+
+    def scan(self):
+        """List images in the folder, naturally sorted, refreshing stale entries"""
+        if not self.folder.is_dir():
+            return []
+
+        images = []
+        seen = set()
+
+        with os.scandir(self.folder) as it:
+            for dir_entry in it:
+                if os.path.splitext(dir_entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                if not dir_entry.is_file():
+                    continue
+
+                stat = dir_entry.stat()
+                entry = self._entries.get(dir_entry.name)
+                if not entry or (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+                    # New or modified file - metadata is filled in lazily
+                    self._entries[dir_entry.name] = {
+                        'mtime_ns': stat.st_mtime_ns,
+                        'size': stat.st_size
+                    }
+                    self._dirty = True
+
+                seen.add(dir_entry.name)
+                images.append(self.folder / dir_entry.name)
+
+        # Forget files that were removed from the folder
+        for name in set(self._entries) - seen:
+            del self._entries[name]
+            self._dirty = True
+
+        return sorted(images, key=natural_sort_key)
+
+    def image_info(self, image_path):
+        """The image_header fields, read from the file header once"""
+        entry = self._entry(image_path)
+        # Entries saved before the orientation was recorded are probed again
+        if 'orientation' not in entry:
+            # PIL only parses the header on open; the context manager closes the file
+            with Image.open(image_path) as img:
+                entry.update(image_header(img))
+            self._dirty = True
+
+        return {key: entry[key] for key in ('width', 'height', 'mode', 'format', 'orientation')}
+
+    def content_hash(self, image_path):
+        """SHA-256 of the file contents, computed once per file version"""
+        entry = self._entry(image_path)
+        if 'sha256' not in entry:
+            entry['sha256'] = file_sha256(image_path)
+            self._dirty = True
+
+        return entry['sha256']
+
+    def record(self, image_path, data, width, height, mode, image_format, orientation=1):
+        """Store the metadata of a file just written from `data`, so it is never probed or hashed"""
+        entry = self._entry(image_path)
+        entry.update({
+            'width': width,
+            'height': height,
+            'mode': mode,
+            'format': image_format,
+            'orientation': orientation,
+            'sha256': hashlib.sha256(data).hexdigest()
+        })
+        self._dirty = True
+
+    def save(self, on_error=None):
+        """
+        Write the sidecar index if anything changed
+
+        A failure is only a warning; on_error, if given, receives its message
+        instead of it being printed.
+        """
+        if not self._dirty:
+            return
+
+        try:
+            tmp_path = self.index_path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'files': self._entries}, f)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+        except OSError as e:
+            # Read-only folders still work, just without the persisted index
+            message = f"Could not save image index: {e}"
+            if on_error:
+                on_error(message)
+            else:
+                print(f"⚠️  Warning: {message}")
+
+    def _entry(self, image_path):
+        """Index entry for a file, re-validated against its current size and mtime"""
+        image_path = Path(image_path)
+        stat = image_path.stat()
+        entry = self._entries.get(image_path.name)
+        if not entry or (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            self._entries[image_path.name] = entry
+            self._dirty = True
+        return entry
+
+    def _load_index(self):
+        """Load the sidecar index, ignoring missing, corrupt or outdated files"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            return {}
+        return data.get('files', {})
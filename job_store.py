@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Persistent Job Store
+SQLite (WAL mode) storage for web generation jobs, per-question results and progress events
+"""
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import uuid
+
+
+# Jobs whose owner stopped updating them for this long are considered abandoned
+STALE_JOB_SECONDS = 600
+
+ACTIVE_STATES = ('queued', 'running')
+
+# Questions are identified by their index, the 1-based position in the
+# extracted list: extraction can yield the same question number twice
+RESULTS_TABLE = """
+CREATE TABLE IF NOT EXISTS results (
+    job_id TEXT NOT NULL,
+    question_index INTEGER NOT NULL,
+    question_number INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (job_id, question_index)
+)"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    input_pdf TEXT NOT NULL,
+    firstaid_pdf TEXT NOT NULL,
+    output_csv TEXT NOT NULL,
+    input_nature TEXT,
+    num_questions TEXT,
+    current_question INTEGER NOT NULL DEFAULT 0,
+    total_questions INTEGER NOT NULL DEFAULT 0,
+    current_message TEXT NOT NULL DEFAULT '',
+    error TEXT,
+    output_file TEXT,
+    owner TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+{results_table};
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS events_by_job ON events (job_id, id);
+
+CREATE TABLE IF NOT EXISTS extractions (
+    exam_sha256 TEXT PRIMARY KEY,
+    questions TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS prompt_cache (
+    exam_sha256 TEXT NOT NULL,
+    firstaid_sha256 TEXT NOT NULL,
+    question_index INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (exam_sha256, firstaid_sha256, question_index)
+);
+""".format(results_table=RESULTS_TABLE.strip())
+
+JOB_FIELDS = ('state', 'current_question', 'total_questions', 'current_message',
+              'error', 'output_file', 'owner')
+
+# Changes a status client waits for; the progress message and the owner
+# heartbeat alone must not wake long-polls on every log line
+VERSIONED_FIELDS = ('state', 'current_question', 'total_questions', 'error', 'output_file')
+
+
+def process_owner():
+    """Identifier of this server process, stored on the jobs it runs"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobStore:
+    """
+    Durable job state shared by every server process
+
+    Each thread gets its own SQLite connection. WAL mode lets readers (status
+    and progress requests) run while a worker thread writes, and lets several
+    WSGI worker processes share one database file.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate(conn)
+        conn.executescript(SCHEMA)
+
+    def _migrate(self, conn):
+        """Bring a database file created by an earlier version up to date"""
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if columns and 'version' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        if columns and 'cancel_requested' not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+
+        # Results and cached prompts used to be keyed by question number. Jobs that
+        # can no longer run keep their results (in number order); those of queued or
+        # running jobs and the cache cannot be mapped to question indexes, so they
+        # are generated again
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(results)")}
+        if columns and 'question_index' not in columns:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another server process may have migrated while this one waited
+                columns = {row['name'] for row in conn.execute("PRAGMA table_info(results)")}
+                if 'question_index' not in columns:
+                    conn.execute("ALTER TABLE results RENAME TO results_by_number")
+                    conn.execute(RESULTS_TABLE)
+                    conn.execute(
+                        "INSERT INTO results (job_id, question_index, question_number, prompt, created_at) "
+                        "SELECT r.job_id, r.question_number, r.question_number, r.prompt, r.created_at "
+                        "FROM results_by_number r JOIN jobs j ON j.id = r.job_id WHERE j.state NOT IN (?, ?)",
+                        ACTIVE_STATES
+                    )
+                    conn.execute("DROP TABLE results_by_number")
+                    conn.execute("DROP TABLE IF EXISTS prompt_cache")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _connect(self):
+        """Connection for the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # Jobs
+
+    def create_job(self, input_pdf, firstaid_pdf, output_csv, input_nature=None, num_questions=None):
+        """
+        Insert a queued job and return it
+
+        Returns None if a queued or running job already writes the same
+        output CSV. The check and insert are one statement, so two server
+        processes cannot both create such a job.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (id, state, input_pdf, firstaid_pdf, output_csv, input_nature, "
+            "num_questions, current_message, created_at, updated_at) "
+            "SELECT ?, 'queued', ?, ?, ?, ?, ?, 'Waiting for a free worker...', ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM jobs WHERE output_csv = ? AND state IN (?, ?))",
+            (job_id, input_pdf, firstaid_pdf, output_csv, input_nature,
+             None if num_questions is None else str(num_questions), now, now, output_csv) + ACTIVE_STATES
+        )
+        if cursor.rowcount == 0:
+            return None
+        return self.get_job(job_id)
+
+    def get_job(self, job_id):
+        """Job as a dict, or None if unknown"""
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, limit=100):
+        """Most recent jobs first"""
+        rows = self._connect().execute(
+            "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def update_job(self, job_id, **fields):
+        """
+        Update job columns
+
+        Updates to VERSIONED_FIELDS bump the job's version (which status
+        long-polls wait on). Every update refreshes updated_at (which acts as
+        a heartbeat).
+        """
+        unknown = set(fields) - set(JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {sorted(unknown)}")
+
+        bump = ', version = version + 1' if set(fields) & set(VERSIONED_FIELDS) else ''
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._connect().execute(
+            f"UPDATE jobs SET {assignments}{bump} WHERE id = ?",
+            tuple(fields.values()) + (job_id,)
+        )
+
+    def claim_job(self, job_id, owner):
+        """Atomically move a queued job to running; False if another process got it"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET state = 'running', owner = ?, updated_at = ?, version = version + 1 "
+            "WHERE id = ? AND state = 'queued'",
+            (owner, time.time(), job_id)
+        )
+        return cursor.rowcount == 1
+
+    def request_cancel(self, job_id):
+        """
+        Ask for a job to stop
+
+        A queued job is cancelled right away, so claim_job skips it and the
+        worker slot goes to the next job ('cancelled'). A running job is
+        flagged, and its owner stops at its next check ('cancelling').
+        Returns None if the job is unknown or already finished.
+        """
+        conn = self._connect()
+        now = time.time()
+
+        cursor = conn.execute(
+            "UPDATE jobs SET state = 'cancelled', cancel_requested = 1, updated_at = ?, version = version + 1 "
+            "WHERE id = ? AND state = 'queued'",
+            (now, job_id)
+        )
+        if cursor.rowcount == 1:
+            return 'cancelled'
+
+        cursor = conn.execute(
+            "UPDATE jobs SET cancel_requested = 1, updated_at = ?, version = version + 1 "
+            "WHERE id = ? AND state = 'running'",
+            (now, job_id)
+        )
+        return 'cancelling' if cursor.rowcount == 1 else None
+
+    def cancel_requested(self, job_id):
+        """Whether request_cancel was called for a job"""
+        row = self._connect().execute(
+            "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def requeue_abandoned(self):
+        """
+        Put running jobs whose owner is gone back in the queue
+
+        An owner is gone when it is a dead process on this host, or when it
+        has not updated the job for STALE_JOB_SECONDS. Abandoned jobs with a
+        pending cancel are cancelled instead. Returns the IDs of all queued
+        jobs, oldest first, so the caller can resume them.
+        """
+        conn = self._connect()
+        hostname = socket.gethostname()
+        stale_before = time.time() - STALE_JOB_SECONDS
+
+        for row in conn.execute("SELECT id, owner, updated_at FROM jobs WHERE state = 'running'").fetchall():
+            host, _, pid = (row['owner'] or '').rpartition(':')
+            abandoned = row['updated_at'] < stale_before
+            if host == hostname and pid.isdigit() and not _pid_alive(int(pid)):
+                abandoned = True
+
+            if abandoned:
+                conn.execute(
+                    "UPDATE jobs SET state = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END, "
+                    "owner = NULL, updated_at = ?, version = version + 1 "
+                    "WHERE id = ? AND state = 'running' AND owner IS ?",
+                    (time.time(), row['id'], row['owner'])
+                )
+
+        rows = conn.execute("SELECT id FROM jobs WHERE state = 'queued' ORDER BY created_at").fetchall()
+        return [row['id'] for row in rows]
+
+    # Results
+
+    def add_result(self, job_id, question_index, question_number, prompt):
+        """Store (or replace) the prompt generated for one question"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO results (job_id, question_index, question_number, prompt, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (job_id, question_index, question_number, prompt, time.time())
+        )
+
+    def get_results(self, job_id, offset=0, limit=None):
+        """Results of a job ordered by question number (then index), optionally one page of them"""
+        rows = self._connect().execute(
+            "SELECT question_number, prompt FROM results WHERE job_id = ? "
+            "ORDER BY question_number, question_index LIMIT ? OFFSET ?",
+            (job_id, -1 if limit is None else limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_results(self, job_id):
+        """Number of questions with a stored result"""
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM results WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+
+    def completed_questions(self, job_id):
+        """Indexes of the questions that already have a result"""
+        rows = self._connect().execute(
+            "SELECT question_index FROM results WHERE job_id = ?", (job_id,)
+        ).fetchall()
+        return {row['question_index'] for row in rows}
+
+    # Caches keyed by content hash, so identical files are processed once
+
+    def get_extraction(self, exam_sha256):
+        """Questions extracted earlier from an exam with this hash, or None"""
+        row = self._connect().execute(
+            "SELECT questions FROM extractions WHERE exam_sha256 = ?", (exam_sha256,)
+        ).fetchone()
+        return json.loads(row['questions']) if row else None
+
+    def save_extraction(self, exam_sha256, questions):
+        """Remember the questions extracted from an exam"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO extractions (exam_sha256, questions, created_at) VALUES (?, ?, ?)",
+            (exam_sha256, json.dumps(questions), time.time())
+        )
+
+    def get_cached_prompts(self, exam_sha256, firstaid_sha256):
+        """Prompts generated earlier for this exam and First Aid edition: question index -> prompt"""
+        rows = self._connect().execute(
+            "SELECT question_index, prompt FROM prompt_cache WHERE exam_sha256 = ? AND firstaid_sha256 = ?",
+            (exam_sha256, firstaid_sha256)
+        ).fetchall()
+        return {row['question_index']: row['prompt'] for row in rows}
+
+    def cache_prompt(self, exam_sha256, firstaid_sha256, question_index, prompt):
+        """Remember the prompt generated for one question (the extraction of an exam is fixed per hash)"""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO prompt_cache "
+            "(exam_sha256, firstaid_sha256, question_index, prompt, created_at) VALUES (?, ?, ?, ?, ?)",
+            (exam_sha256, firstaid_sha256, question_index, prompt, time.time())
+        )
+
+    # Progress events
+
+    def add_event(self, job_id, payload):
+        """Append a progress event; returns its monotonically increasing ID"""
+        cursor = self._connect().execute(
+            "INSERT INTO events (job_id, payload, created_at) VALUES (?, ?, ?)",
+            (job_id, json.dumps(payload), time.time())
+        )
+        return cursor.lastrowid
+
+    def get_events(self, job_id, after_id=0, limit=500):
+        """Events of a job with ID greater than after_id, oldest first"""
+        rows = self._connect().execute(
+            "SELECT id, payload FROM events WHERE job_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (job_id, after_id, limit)
+        ).fetchall()
+        return [(row['id'], json.loads(row['payload'])) for row in rows]
+
+
+def _pid_alive(pid):
+    """Whether a process with this PID exists on this host"""
+    # On Windows os.kill(pid, 0) terminates the process instead of probing it
+    if os.name == 'nt':
+        return _windows_pid_alive(pid)
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _windows_pid_alive(pid):
+    """_pid_alive through OpenProcess/GetExitCodeProcess"""
+    import ctypes
+    from ctypes import wintypes
+
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    ERROR_ACCESS_DENIED = 5
+    STILL_ACTIVE = 259
+
+    kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        # The process exists but belongs to someone else
+        return ctypes.get_last_error() == ERROR_ACCESS_DENIED
+
+    try:
+        exit_code = wintypes.DWORD()
+        if not kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code)):
+            return True
+        return exit_code.value == STILL_ACTIVE
+    finally:
+        kernel32.CloseHandle(handle)
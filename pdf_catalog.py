@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+PDF Catalog
+Cached discovery of exam and First Aid PDFs in a folder, shared by the web app, GUI and CLI
+"""
+
+import os
+import threading
+from pathlib import Path
+import PyPDF2
+from file_hash import file_sha256
+
+
+# Checked in this order; the first one present is the First Aid reference
+FIRSTAID_NAMES = ('first aid.pdf', 'firstaid.pdf', 'First Aid.pdf')
+_FIRSTAID_NAMES_LOWER = {name.lower() for name in FIRSTAID_NAMES}
+
+
+class PDFCatalog:
+    """
+    Catalog of the PDFs in one folder
+
+    The folder is listed with a single os.scandir pass and the listing is
+    reused until the folder's mtime changes (a file was added, removed or
+    renamed), so repeated lookups do not touch the disk. Page counts and
+    SHA-256 hashes are computed on first request and kept while a file's
+    size and mtime are unchanged.
+    """
+
+    def __init__(self, folder='.'):
+        self.folder = Path(folder)
+        self._lock = threading.Lock()
+        self._dir_mtime_ns = None
+        self._entries = {}
+
+    def refresh(self):
+        """Rescan the folder if its mtime changed since the last scan"""
+        with self._lock:
+            try:
+                dir_mtime_ns = self.folder.stat().st_mtime_ns
+            except OSError:
+                self._dir_mtime_ns = None
+                self._entries = {}
+                return
+
+            if dir_mtime_ns == self._dir_mtime_ns:
+                return
+
+            entries = {}
+            with os.scandir(self.folder) as it:
+                for dir_entry in it:
+                    if not dir_entry.name.lower().endswith('.pdf') or not dir_entry.is_file():
+                        continue
+
+                    stat = dir_entry.stat()
+                    entry = self._entries.get(dir_entry.name)
+                    if not entry or (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+                        entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+                    entries[dir_entry.name] = entry
+
+            self._entries = entries
+            self._dir_mtime_ns = dir_mtime_ns
+
+    def pdfs(self):
+        """All PDFs in the folder, sorted by name"""
+        self.refresh()
+        return [self.folder / name for name in sorted(self._entries, key=str.lower)]
+
+    def firstaid_pdf(self):
+        """The First Aid reference PDF, or None"""
+        self.refresh()
+        for name in FIRSTAID_NAMES:
+            if name in self._entries:
+                return self.folder / name
+        for name in sorted(self._entries):
+            if name.lower() in _FIRSTAID_NAMES_LOWER:
+                return self.folder / name
+        return None
+
+    def exam_pdfs(self):
+        """Every PDF except the First Aid reference"""
+        return [pdf for pdf in self.pdfs() if pdf.name.lower() not in _FIRSTAID_NAMES_LOWER]
+
+    def info(self, pdf_path):
+        """Name and size in bytes, from the cached scan"""
+        self.refresh()
+        entry = self._entries.get(Path(pdf_path).name) or self._entry(pdf_path)
+        return {'name': Path(pdf_path).name, 'size': entry['size']}
+
+    def page_count(self, pdf_path):
+        """Number of pages (None if the PDF cannot be read), read once per file version"""
+        entry = self._entry(pdf_path)
+        if 'pages' not in entry:
+            try:
+                with open(pdf_path, 'rb') as f:
+                    entry['pages'] = len(PyPDF2.PdfReader(f).pages)
+            except Exception:
+                entry['pages'] = None
+        return entry['pages']
+
+    def content_hash(self, pdf_path):
+        """SHA-256 of the file contents, computed once per file version"""
+        entry = self._entry(pdf_path)
+        if 'sha256' not in entry:
+            entry['sha256'] = file_sha256(pdf_path)
+        return entry['sha256']
+
+    def record_hash(self, pdf_path, sha256):
+        """Store a hash computed while the file was written, so it is not read again"""
+        self._entry(pdf_path)['sha256'] = sha256
+
+    def _entry(self, pdf_path):
+        """Catalog entry for a file, re-validated against its current size and mtime"""
+        pdf_path = Path(pdf_path)
+        # Only the folder is resolved: a PDF in it may be a symlink to a file elsewhere
+        if pdf_path.absolute().parent.resolve() != self.folder.resolve():
+            raise ValueError(f"{pdf_path} is not in {self.folder}")
+
+        stat = pdf_path.stat()
+        with self._lock:
+            entry = self._entries.get(pdf_path.name)
+            if not entry or (entry['mtime_ns'], entry['size']) != (stat.st_mtime_ns, stat.st_size):
+                # Overwriting a file in place does not change the folder mtime
+                entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+                self._entries[pdf_path.name] = entry
+            return entry
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(folder='.'):
+    """Process-wide catalog for a folder"""
+    folder = Path(folder).resolve()
+    with _catalogs_lock:
+        if folder not in _catalogs:
+            _catalogs[folder] = PDFCatalog(folder)
+        return _catalogs[folder]
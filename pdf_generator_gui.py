@@ -3,15 +3,16 @@
 PDF Generator GUI - Create professional PDFs from images
 """
 
-import os
+import queue
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
+from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
 import threading
 from generate_pdf_from_images import PDFGenerator
+from tk_ui_queue import UIQueueMixin, UI_REFRESH_MS
 
 
-class PDFGeneratorGUI:
+class PDFGeneratorGUI(UIQueueMixin):
     def __init__(self, root):
         self.root = root
         self.root.title("PDF Generator - Images to Professional PDF")
@@ -22,8 +23,12 @@ class PDFGeneratorGUI:
         self.output_pdf = tk.StringVar(value="output.pdf")
         self.title_var = tk.StringVar(value="NBME 30")
         self.additional_text = tk.StringVar()
+        self.ui_queue = queue.Queue()
+        self.pages_done = 0
+        self.warnings = 0  # Counted on the worker thread during a run
         
         self._build_ui()
+        self.root.after(UI_REFRESH_MS, self._drain_ui_queue)
     
     def _build_ui(self):
         """Build the UI"""
@@ -97,6 +102,12 @@ class PDFGeneratorGUI:
                                       font=("Helvetica", 12, "bold"), padx=10, pady=10)
         progress_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 15))
         
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate')
+        self.progress_bar.pack(fill=tk.X, pady=(0, 5))
+        
+        self.progress_label = tk.Label(progress_frame, text="", font=("Helvetica", 9), fg="gray")
+        self.progress_label.pack(anchor=tk.W, pady=(0, 10))
+        
         self.status_text = scrolledtext.ScrolledText(
             progress_frame,
             height=10,
@@ -142,10 +153,43 @@ class PDFGeneratorGUI:
             self.output_pdf.set(filename)
     
     def _log(self, message):
-        """Add message to status log"""
-        self.status_text.insert(tk.END, message + "\n")
-        self.status_text.see(tk.END)
-        self.root.update_idletasks()
+        """Add message to status log (safe from any thread)"""
+        self.ui_queue.put(('log', message))
+    
+    def _on_progress(self, event):
+        """PDFGenerator progress callback (runs on the worker thread)"""
+        if event['event'] == 'start':
+            self._log(f"✓ Found {event['images']} images ({event['total_pages']} pages)")
+            self.ui_queue.put(('progress', event))
+        elif event['event'] == 'page':
+            note = " (cached)" if event['cached'] else f" in {event['seconds']:.2f}s"
+            self._log(f"[{event['page']}/{event['total_pages']}] Page {event['page']}{note}")
+            self.ui_queue.put(('progress', event))
+        elif event['event'] == 'stage':
+            self._log(event['message'])
+        elif event['event'] == 'warning':
+            self.warnings += 1
+            self._log(f"⚠️  Warning: {event['message']}")
+        elif event['event'] == 'done':
+            self._log(f"✅ PDF created in {event['elapsed']:.1f}s: {event['output']}")
+    
+    def _show_progress(self, events):
+        """Progress bar and page rate for the progress events of one frame"""
+        for event in events:
+            if event['event'] == 'start':
+                self.pages_done = 0
+            else:
+                self.pages_done += 1
+        
+        progress = events[-1]
+        total = progress['total_pages']
+        self.progress_bar.config(maximum=max(total, 1), value=self.pages_done)
+        
+        # Pages can finish out of order (volumes), so count them instead of using the page number
+        text = f"{self.pages_done}/{total} pages"
+        if self.pages_done and progress['elapsed'] > 0:
+            text += f" • {self.pages_done / progress['elapsed']:.1f} pages/sec"
+        self.progress_label.config(text=text)
     
     def _start_generation(self):
         """Start PDF generation"""
@@ -165,53 +209,50 @@ class PDFGeneratorGUI:
         # Disable button
         self.generate_btn.config(state=tk.DISABLED, text="⏳ Generating...")
         self.status_text.delete(1.0, tk.END)
+        self.progress_bar.config(value=0)
+        self.progress_label.config(text="")
+        
+        # Tk variables are read here on the UI thread, never from the worker
+        args = (self.image_folder.get(), self.output_pdf.get(),
+                self.title_var.get(), self.additional_text.get())
         
         # Run in background
-        thread = threading.Thread(target=self._run_generation, daemon=True)
+        thread = threading.Thread(target=self._run_generation, args=args, daemon=True)
         thread.start()
     
-    def _run_generation(self):
-        """Run the actual PDF generation"""
+    def _run_generation(self, image_folder, output_pdf, title, additional_text):
+        """Run the actual PDF generation (worker thread; no Tk calls)"""
+        self.warnings = 0
         try:
             # Create generator
             generator = PDFGenerator(
-                title=self.title_var.get(),
-                additional_text=self.additional_text.get()
+                title=title,
+                additional_text=additional_text
             )
             
-            # Redirect output
-            import io
-            import sys
-            
-            old_stdout = sys.stdout
-            sys.stdout = io.StringIO()
-            
-            # Generate PDF
+            # Generate PDF (progress is reported page by page while it builds)
             success = generator.create_pdf(
-                self.image_folder.get(),
-                self.output_pdf.get()
+                image_folder,
+                output_pdf,
+                progress=self._on_progress
             )
             
-            # Get output
-            output = sys.stdout.getvalue()
-            sys.stdout = old_stdout
-            
-            # Display output
-            for line in output.split('\n'):
-                self.root.after(0, lambda l=line: self._log(l))
-            
             if success:
-                self.root.after(0, lambda: messagebox.showinfo(
+                note = f"\n\n⚠️ {self.warnings} warning(s) - see the log" if self.warnings else ""
+                self._call_in_ui(lambda: messagebox.showinfo(
                     "Success!",
-                    f"PDF created successfully!\n\nSaved to:\n{self.output_pdf.get()}"
+                    f"PDF created successfully!\n\nSaved to:\n{output_pdf}{note}"
                 ))
+            else:
+                self._log("❌ No images found in folder!")
             
         except Exception as e:
-            self.root.after(0, lambda: self._log(f"\n❌ Error: {str(e)}"))
-            self.root.after(0, lambda: messagebox.showerror("Error", f"An error occurred:\n{str(e)}"))
+            error = str(e)
+            self._log(f"\n❌ Error: {error}")
+            self._call_in_ui(lambda: messagebox.showerror("Error", f"An error occurred:\n{error}"))
         
         finally:
-            self.root.after(0, lambda: self.generate_btn.config(
+            self._call_in_ui(lambda: self.generate_btn.config(
                 state=tk.NORMAL, 
                 text="📄 Generate PDF"
             ))
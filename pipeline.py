@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Prompt Pipeline
+The per-question engine shared by the CLI, web app and GUI: executors decide how
+questions run, sinks receive progress and finished prompts, hooks observe events
+"""
+
+import os
+import csv
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from generate_study_prompts import GenerationCancelled
+
+
+# Questions generated at once within one run (1 = one after another)
+PIPELINE_WORKERS = max(int(os.getenv('PIPELINE_WORKERS', '1')), 1)
+
+
+# Events, sent to every sink's event() and every hook as (name, **fields):
+#   'start'     total, pending, skipped
+#   'question'  index, total, number, cached
+#   'stage'     index, number, stage ('concepts' or 'prompt')
+#   'concepts'  index, number, concepts
+#   'result'    index, total, question_number, prompt, source ('generated' or 'cache'), concepts
+#   'end'       status ('completed', 'cancelled' or 'failed'), total, completed
+
+
+class Sink:
+    """Pipeline output; subclasses override what they need"""
+
+    def event(self, name, **fields):
+        """Progress event (see the list above)"""
+
+    def add(self, result):
+        """Finished prompt: {'index', 'question_number', 'prompt', 'source', 'concepts'}"""
+
+    def close(self, status):
+        """Run finished with status 'completed', 'cancelled' or 'failed'"""
+
+
+class CSVSink(Sink):
+    """Writes the prompts, sorted by question number, when the run ends"""
+
+    def __init__(self, path):
+        self.path = path
+        self.results = []
+
+    def add(self, result):
+        self.results.append(result)
+
+    def close(self, status):
+        # A cancelled run keeps the prompts finished before the cancel
+        if status == 'failed':
+            return
+
+        self.results.sort(key=lambda x: x['question_number'])
+        with open(self.path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['Question Number', 'Prompt'])
+            for result in self.results:
+                writer.writerow([result['question_number'], result['prompt']])
+
+
+def print_progress(name, **fields):
+    """Hook printing progress to the console (the CLI output)"""
+    if name == 'question' and not fields['cached']:
+        print(f"\n[{fields['index']}/{fields['total']}] Processing Question {fields['number']}...")
+    elif name == 'stage' and fields['stage'] == 'concepts':
+        print(f"  → Identifying key concepts...")
+    elif name == 'concepts':
+        print(f"  → Concepts: {fields['concepts'][:100]}...")
+    elif name == 'stage' and fields['stage'] == 'prompt':
+        print(f"  → Generating enriched prompt...")
+    elif name == 'result' and fields['source'] == 'generated':
+        print(f"  ✓ Complete")
+
+
+# Executors
+
+class SerialExecutor:
+    """One question after another, in order"""
+
+    def run(self, pipeline, work):
+        for index, question in work:
+            pipeline.finish(index, pipeline.process(index, question))
+
+
+class ThreadExecutor:
+    """
+    Up to `workers` questions at once on a thread pool
+
+    Results reach the sinks on the calling thread as they finish, so they
+    can arrive out of order. When a question fails, the generator's cancel
+    token is cancelled to abort the others' requests, and the run returns
+    only once their threads have stopped.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+
+    def run(self, pipeline, work):
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='pipeline')
+        futures = {}
+        try:
+            futures = {pool.submit(pipeline.process, index, question): index for index, question in work}
+            for future in as_completed(futures):
+                pipeline.finish(futures[future], future.result())
+        except BaseException:
+            # After a cancel or error, questions not started yet are dropped
+            # and the running ones stop at their next request or checkpoint
+            for future in futures:
+                future.cancel()
+            pipeline.generator.cancel_token.cancel()
+            raise
+        finally:
+            # No sink hears from a question after the run has ended
+            pool.shutdown(wait=True)
+
+
+class AsyncioExecutor:
+    """
+    Up to `concurrency` questions at once as tasks on the event loop
+
+    Uses the generator's async client. Cancelling the run's token (from any
+    thread) cancels the tasks, which aborts their in-flight requests.
+    Sinks, hooks and the checkpoint may block (the web app's write to
+    SQLite), so they run in order on one thread of their own, off the loop.
+    """
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+
+    def run(self, pipeline, work):
+        asyncio.run(self.arun(pipeline, work))
+
+    async def arun(self, pipeline, work):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def one(index, question):
+            async with semaphore:
+                result = await pipeline.aprocess(index, question)
+            await pipeline.call(pipeline.finish, index, result)
+
+        tasks = [loop.create_task(one(index, question)) for index, question in work]
+
+        def cancel_tasks():
+            for task in tasks:
+                loop.call_soon_threadsafe(task.cancel)
+
+        token = pipeline.generator.cancel_token
+        token.on_cancel(cancel_tasks)
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            if not token.cancelled:
+                raise  # The run itself was cancelled, e.g. at server shutdown
+            raise GenerationCancelled()
+        finally:
+            token.remove_callback(cancel_tasks)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def default_executor(asynchronous=False):
+    """Executor for PIPELINE_WORKERS questions at once"""
+    if asynchronous:
+        return AsyncioExecutor(PIPELINE_WORKERS)
+    if PIPELINE_WORKERS > 1:
+        return ThreadExecutor(PIPELINE_WORKERS)
+    return SerialExecutor()
+
+
+class Pipeline:
+    """
+    Turns extracted questions into study prompts
+
+    For each question the generator identifies the key concepts and then
+    writes the enriched prompt. The executor decides how many questions run
+    at once; every finished prompt goes to each sink. The checkpoint runs
+    between stages and raises GenerationCancelled to stop the run (by
+    default it checks the generator's cancel token).
+    """
+
+    def __init__(self, generator, executor=None, sinks=(), hooks=(), checkpoint=None):
+        self.generator = generator
+        self.executor = executor or default_executor()
+        self.sinks = list(sinks)
+        self.hooks = list(hooks)
+        self.checkpoint = checkpoint or generator.cancel_token.raise_if_cancelled
+        self._lock = threading.RLock()
+        self.total = 0
+        self.counts = {'generated': 0, 'cache': 0}
+        self._sink_thread = None
+
+    def run(self, questions, completed=(), cached=None):
+        """
+        Generate the prompts of a list of questions; returns a summary dict
+
+        Questions are identified by index, their 1-based position in the
+        list (extraction can repeat a number). Indexes in `completed` are
+        skipped, and those in `cached` (index -> prompt) are passed to the
+        sinks without calling the API. A cancel ends the run with status
+        'cancelled'; errors are re-raised.
+        """
+        work = self._prepare(questions, completed, cached)
+        try:
+            self.executor.run(self, work)
+        except GenerationCancelled:
+            return self._end('cancelled')
+        except BaseException:
+            self._end('failed')
+            raise
+        return self._end('completed')
+
+    async def arun(self, questions, completed=(), cached=None):
+        """run() on the event loop; the executor must be an AsyncioExecutor"""
+        self._sink_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-sinks')
+        try:
+            work = await self.call(self._prepare, questions, completed, cached)
+            try:
+                await self.executor.arun(self, work)
+            except GenerationCancelled:
+                return await self.call(self._end, 'cancelled')
+            except BaseException:
+                # Queued behind the calls already made; not awaited, since a server
+                # shutdown cancels this task and the loop may stop first
+                self._sink_thread.submit(self._end, 'failed')
+                raise
+            return await self.call(self._end, 'completed')
+        finally:
+            self._sink_thread.shutdown(wait=False)
+            self._sink_thread = None
+
+    def process(self, index, question):
+        """Generate the prompt for one question (on the executor's thread)"""
+        number = question['number']
+        self.checkpoint()
+        self._emit('question', index=index, total=self.total, number=number, cached=False)
+
+        # Identify concepts
+        self._emit('stage', index=index, number=number, stage='concepts')
+        concepts = self.generator.identify_key_concepts(question['content'])
+        self._emit('concepts', index=index, number=number, concepts=concepts)
+        self.checkpoint()
+
+        # Generate prompt
+        self._emit('stage', index=index, number=number, stage='prompt')
+        prompt = self.generator.generate_enriched_prompt(number, question['content'], concepts)
+        return {'question_number': number, 'prompt': prompt, 'source': 'generated', 'concepts': concepts}
+
+    async def aprocess(self, index, question):
+        """process() on the generator's async client"""
+        number = question['number']
+        await self.call(self.checkpoint)
+        await self.call(self._emit, 'question', index=index, total=self.total, number=number, cached=False)
+
+        await self.call(self._emit, 'stage', index=index, number=number, stage='concepts')
+        concepts = await self.generator.aidentify_key_concepts(question['content'])
+        await self.call(self._emit, 'concepts', index=index, number=number, concepts=concepts)
+        await self.call(self.checkpoint)
+
+        await self.call(self._emit, 'stage', index=index, number=number, stage='prompt')
+        prompt = await self.generator.agenerate_enriched_prompt(number, question['content'], concepts)
+        return {'question_number': number, 'prompt': prompt, 'source': 'generated', 'concepts': concepts}
+
+    async def call(self, func, *args, **kwargs):
+        """Run a sink, hook or checkpoint call off the loop (in submission order within arun())"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._sink_thread, functools.partial(func, *args, **kwargs))
+
+    def finish(self, index, result):
+        """Hand a finished prompt to the sinks (called by executors)"""
+        result = dict(result, index=index)
+        with self._lock:
+            self.counts[result['source']] += 1
+            for sink in self.sinks:
+                sink.add(result)
+            self._emit('result', total=self.total, **result)
+
+    def _prepare(self, questions, completed, cached):
+        """Announce the run, pass cached prompts on and return the (index, question) pairs to generate"""
+        cached = cached or {}
+        self.total = len(questions)
+        self.counts = {'generated': 0, 'cache': 0}
+
+        remaining = [(index, q) for index, q in enumerate(questions, 1) if index not in completed]
+        self._emit('start', total=self.total, pending=len(remaining), skipped=self.total - len(remaining))
+
+        work = []
+        for index, q in remaining:
+            if index in cached:
+                self._emit('question', index=index, total=self.total, number=q['number'], cached=True)
+                self.finish(index, {'question_number': q['number'], 'prompt': cached[index],
+                                    'source': 'cache', 'concepts': None})
+            else:
+                work.append((index, q))
+        return work
+
+    def _end(self, status):
+        """Announce the end of the run, close the sinks and summarize"""
+        completed = sum(self.counts.values())
+        self._emit('end', status=status, total=self.total, completed=completed)
+        for sink in self.sinks:
+            sink.close(status)
+        return {'status': status, 'total': self.total, 'completed': completed,
+                'generated': self.counts['generated'], 'cached': self.counts['cache']}
+
+    def _emit(self, name, **fields):
+        """Send an event to the sinks and hooks; a failing hook never breaks the run"""
+        with self._lock:
+            for sink in self.sinks:
+                sink.event(name, **fields)
+            for hook in self.hooks:
+                try:
+                    hook(name, **fields)
+                except Exception as e:
+                    print(f"Warning: Pipeline hook failed: {e}")
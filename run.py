@@ -8,12 +8,12 @@ import os
 import sys
 from pathlib import Path
 from generate_study_prompts import MedicalPromptGenerator
+from pdf_catalog import get_catalog
 
 
 def list_pdf_files():
-    """List all PDF files in current directory"""
-    pdfs = list(Path('.').glob('*.pdf'))
-    return [p for p in pdfs if p.name != 'firstaid.pdf']
+    """List exam PDF files in current directory"""
+    return get_catalog('.').exam_pdfs()
 
 
 def main():
@@ -23,12 +23,8 @@ def main():
     print()
     
     # Check for First Aid (handle both naming conventions)
-    if os.path.exists('first aid.pdf'):
-        firstaid_path = 'first aid.pdf'
-    elif os.path.exists('firstaid.pdf'):
-        firstaid_path = 'firstaid.pdf'
-    else:
-        firstaid_path = None
+    firstaid = get_catalog('.').firstaid_pdf()
+    firstaid_path = str(firstaid) if firstaid else None
     
     if not firstaid_path:
         print("❌ Error: firstaid.pdf not found!")
@@ -73,7 +69,7 @@ def main():
         # Interactive selection
         print("Found exam PDFs:")
         for i, pdf in enumerate(exam_pdfs, 1):
-            size_mb = pdf.stat().st_size / (1024 * 1024)
+            size_mb = get_catalog('.').info(pdf)['size'] / (1024 * 1024)
             print(f"  {i}. {pdf.name} ({size_mb:.1f} MB)")
         print()
         
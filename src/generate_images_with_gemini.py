@@ -28,6 +28,7 @@ except ImportError:
 
 # Import PDF generator
 from generate_pdf_from_images import PDFGenerator
+from image_catalog import ImageCatalog
 
 # Load environment
 load_dotenv()
@@ -53,7 +54,7 @@ class GeminiImageGenerator:
         self.model = model
         print(f"✓ Initialized Gemini client with model: {model}")
     
-    def generate_image(self, prompt, output_path, question_num=None):
+    def generate_image(self, prompt, output_path, question_num=None, catalog=None):
         """
         Generate an image from a text prompt using Gemini API
         
@@ -61,6 +62,7 @@ class GeminiImageGenerator:
             prompt: Text description to generate image from
             output_path: Path to save the generated image
             question_num: Optional question number for progress tracking
+            catalog: Optional ImageCatalog of the output folder to record the image in
         
         Returns:
             Path to saved image or None if failed
@@ -103,7 +105,14 @@ class GeminiImageGenerator:
             image = Image.open(BytesIO(image_data))
             output_path = Path(output_path)
             output_path.parent.mkdir(parents=True, exist_ok=True)
-            image.save(output_path, format='PNG')
+            buffer = BytesIO()
+            image.save(buffer, format='PNG')
+            output_path.write_bytes(buffer.getvalue())
+            
+            # Dimensions and hash are known here, so the PDF run never re-reads the file
+            if catalog is not None:
+                catalog.record(output_path, buffer.getvalue(), image.width, image.height,
+                               image.mode, 'PNG')
             
             if question_num:
                 print(f"  ✓ Saved: {output_path.name}")
@@ -250,6 +259,9 @@ The final image should be a complete, self-contained educational resource that v
         output_folder = Path(output_folder)
         output_folder.mkdir(parents=True, exist_ok=True)
         
+        # Catalog shared with the PDF step (sidecar metadata index)
+        catalog = ImageCatalog(output_folder)
+        
         # Generate images
         generated_images = []
         total = len(questions)
@@ -261,7 +273,7 @@ The final image should be a complete, self-contained educational resource that v
             image_path = output_folder / f"{q_num}.png"
             
             # Generate image
-            result = self.generate_image(prompt, image_path, question_num=q_num)
+            result = self.generate_image(prompt, image_path, question_num=q_num, catalog=catalog)
             
             if result:
                 generated_images.append(result)
@@ -272,6 +284,10 @@ The final image should be a complete, self-contained educational resource that v
             
             print()
         
+        # Save the recorded metadata so the PDF run reuses it
+        catalog.scan()
+        catalog.save()
+        
         print("=" * 60)
         print(f"✅ Generated {len(generated_images)}/{total} images")
         print(f"📁 Saved to: {output_folder}")
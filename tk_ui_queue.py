@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tk UI Queue
+Batched UI updates from worker threads, shared by the desktop GUIs
+"""
+
+import queue
+import tkinter as tk
+
+
+# The worker thread never touches Tk: it queues UI updates, and the main loop
+# applies everything queued since the last frame in one batch
+UI_REFRESH_MS = 50
+MAX_LOG_LINES = 2000
+
+
+class UIQueueMixin:
+    """Drains self.ui_queue into self.status_text on the Tk main loop
+
+    Workers queue ('log', line), ('progress', update) and ('call', callback);
+    subclasses implement _show_progress(updates) for the progress items of a frame.
+    """
+    
+    def _call_in_ui(self, callback):
+        """Run callback on the Tk main loop (safe from any thread)"""
+        self.ui_queue.put(('call', callback))
+    
+    def _drain_ui_queue(self):
+        """Apply queued UI updates in one batch, then reschedule"""
+        lines = []
+        updates = []
+        callbacks = []
+        
+        while True:
+            try:
+                item = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            
+            if item[0] == 'log':
+                lines.append(item[1])
+            elif item[0] == 'progress':
+                updates.append(item[1])
+            else:
+                callbacks.append(item[1])
+        
+        if lines:
+            # One insert per frame, and the buffer keeps only the newest lines
+            self.status_text.insert(tk.END, "\n".join(lines) + "\n")
+            excess = int(self.status_text.index('end-1c').split('.')[0]) - 1 - MAX_LOG_LINES
+            if excess > 0:
+                self.status_text.delete("1.0", f"{excess + 1}.0")
+            self.status_text.see(tk.END)
+        
+        if updates:
+            self._show_progress(updates)
+        
+        for callback in callbacks:
+            callback()
+        
+        self.root.after(UI_REFRESH_MS, self._drain_ui_queue)
@@ -5,16 +5,26 @@ Beautiful web interface with real-time progress updates
 """
 
 import os
-import sys
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, Response, send_file
+from flask import Flask, render_template, request, jsonify, Response
 from flask_cors import CORS
 from dotenv import load_dotenv, set_key
+import io
 import json
 import time
-from generate_study_prompts import MedicalPromptGenerator
+import csv
+import hashlib
+import tempfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from generate_study_prompts import (MedicalPromptGenerator, preload_firstaid,
+                                    fallback_prompt, FALLBACK_CONCEPTS, add_instrumentation_hook,
+                                    CancellationToken)
+from pipeline import Pipeline, Sink, PIPELINE_WORKERS
+from metrics import REGISTRY, Counter, Gauge, Histogram
+from job_store import JobStore, process_owner
+from pdf_catalog import get_catalog
 import threading
-import queue
 
 # Load environment
 load_dotenv()
@@ -22,105 +32,382 @@ load_dotenv()
 app = Flask(__name__)
 CORS(app)
 
-# Global variables for progress tracking
-progress_queue = queue.Queue()
-generation_status = {
-    'is_running': False,
-    'current_question': 0,
-    'total_questions': 0,
-    'current_message': '',
-    'error': None,
-    'output_file': None
-}
-
-
-def log_progress(message):
-    """Add message to progress queue"""
-    progress_queue.put({
+# Jobs beyond this limit wait in the executor queue until a slot frees up
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', '2'))
+job_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix='generation')
+
+# Set by asgi_app.py, which runs startup work and jobs on its event loop instead
+ASYNC_MODE = os.getenv('WEB_ASYNC_MODE') == '1'
+
+# Durable job state, shared by every server process using the same file
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'jobs.db')
+job_store = JobStore(JOB_DB_PATH)
+owner_id = process_owner()
+
+# Uploaded exams are stored once per content hash: uploads/<sha256>.pdf
+UPLOAD_DIR = Path(os.getenv('UPLOAD_DIR', 'uploads'))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '200')) * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+# SSE streams and status long-polls in this process wake up when a local job
+# changes. They also poll the store, so changes made by other processes still arrive.
+EVENT_POLL_SECONDS = 1.0
+LONG_POLL_SECONDS = 25
+RESULTS_PAGE_SIZE = 100
+event_condition = threading.Condition()
+event_counter = 0
+# Extra callables run on every change, e.g. to wake asyncio waiters in asgi_app.py
+change_listeners = []
+
+# Cancellation tokens of the jobs running in this process, by job ID
+cancel_tokens = {}
+cancel_tokens_lock = threading.Lock()
+
+
+# Prometheus metrics for /metrics (per server process)
+JOBS_STARTED = Counter('prompt_jobs_started_total', 'Generation jobs started')
+JOBS_COMPLETED = Counter('prompt_jobs_completed_total', 'Generation jobs completed')
+JOBS_FAILED = Counter('prompt_jobs_failed_total', 'Generation jobs failed')
+JOBS_CANCELLED = Counter('prompt_jobs_cancelled_total', 'Generation jobs cancelled')
+JOBS_QUEUED = Gauge('prompt_jobs_queued', 'Jobs waiting for a free worker')
+JOBS_RUNNING = Gauge('prompt_jobs_running', 'Jobs currently running')
+QUESTIONS_PROCESSED = Counter('prompt_questions_processed_total', 'Questions with a finished prompt',
+                              ['source'])
+OPENAI_LATENCY = Histogram('prompt_openai_request_seconds', 'OpenAI request latency by stage', ['stage'])
+OPENAI_ERRORS = Counter('prompt_openai_errors_total', 'Failed OpenAI requests by stage', ['stage'])
+OPENAI_CANCELLED = Counter('prompt_openai_cancelled_total', 'OpenAI requests abandoned by a cancel, by stage',
+                           ['stage'])
+OPENAI_TOKENS = Counter('prompt_openai_tokens_total', 'OpenAI tokens consumed', ['stage', 'kind'])
+FIRSTAID_LOOKUPS = Counter('prompt_firstaid_cache_lookups_total', 'First Aid index lookups', ['result'])
+SSE_SUBSCRIBERS = Gauge('prompt_sse_subscribers', 'Open progress event streams')
+
+
+def record_generator_event(event, **fields):
+    """Instrumentation hook feeding MedicalPromptGenerator events into the metrics"""
+    if event == 'api_call':
+        OPENAI_LATENCY.observe(fields['seconds'], stage=fields['stage'])
+        OPENAI_TOKENS.inc(fields['prompt_tokens'], stage=fields['stage'], kind='prompt')
+        OPENAI_TOKENS.inc(fields['completion_tokens'], stage=fields['stage'], kind='completion')
+        if fields['error']:
+            OPENAI_ERRORS.inc(stage=fields['stage'])
+    elif event == 'api_cancelled':
+        OPENAI_CANCELLED.inc(stage=fields['stage'])
+    elif event == 'firstaid_lookup':
+        FIRSTAID_LOOKUPS.inc(result='hit' if fields['hit'] else 'miss')
+
+
+add_instrumentation_hook(record_generator_event)
+
+
+def job_status_dict(job):
+    """Public status payload for a stored job"""
+    return {
+        'job_id': job['id'],
+        'state': job['state'],
+        'input_pdf': job['input_pdf'],
+        'is_running': job['state'] in ('queued', 'running'),
+        'current_question': job['current_question'],
+        'total_questions': job['total_questions'],
+        'current_message': job['current_message'],
+        'error': job['error'],
+        'output_file': job['output_file'],
+        'cancel_requested': bool(job['cancel_requested']),
+        'created_at': job['created_at'],
+        'version': job['version']
+    }
+
+
+def notify_subscribers():
+    """Wake the SSE streams and status long-polls waiting in this process"""
+    global event_counter
+    
+    with event_condition:
+        event_counter += 1
+        event_condition.notify_all()
+    
+    for listener in list(change_listeners):
+        listener()
+
+
+def wait_for_change(seen, timeout):
+    """Block until notify_subscribers runs after `seen` was read, or the timeout; True if woken"""
+    with event_condition:
+        return event_condition.wait_for(lambda: event_counter != seen, timeout=timeout)
+
+
+def current_change():
+    """Change counter to pass to wait_for_change later"""
+    with event_condition:
+        return event_counter
+
+
+def update_job(job_id, **fields):
+    """Update a stored job and wake anyone waiting on its status"""
+    job_store.update_job(job_id, **fields)
+    notify_subscribers()
+
+
+def publish_event(job_id, event):
+    """Append an event to the job's log and wake this process's SSE streams"""
+    job_store.add_event(job_id, event)
+    notify_subscribers()
+
+
+def log_progress(job_id, message):
+    """Append a progress message to the job's event log"""
+    job_store.update_job(job_id, current_message=message)
+    publish_event(job_id, {
         'message': message,
         'timestamp': time.time()
     })
-    generation_status['current_message'] = message
 
 
-def run_generation(input_pdf, firstaid_pdf, output_csv, input_nature, num_questions):
-    """Run the generation process in background"""
-    global generation_status
+def submit_job(job_id):
+    """Run a stored job on the worker pool; extra jobs wait in its queue"""
+    JOBS_QUEUED.inc()
+    job_executor.submit(run_generation, job_id)
+
+
+def resume_unfinished_jobs():
+    """Requeue jobs left behind by a stopped server and run them here"""
+    job_ids = job_store.requeue_abandoned()
+    for job_id in job_ids:
+        submit_job(job_id)
+    return job_ids
+
+
+def begin_job(job_id):
+    """Claim a queued job for this process and announce it; None if another process got it"""
+    JOBS_QUEUED.dec()
     
-    try:
-        generation_status['is_running'] = True
-        generation_status['error'] = None
-        generation_status['current_question'] = 0
+    if not job_store.claim_job(job_id, owner_id):
+        return None
+    with cancel_tokens_lock:
+        cancel_tokens[job_id] = CancellationToken()
+    notify_subscribers()
+    JOBS_STARTED.inc()
+    JOBS_RUNNING.inc()
+    
+    update_job(job_id, error=None)
+    log_progress(job_id, "=" * 60)
+    log_progress(job_id, "🚀 Starting Medical Study Prompt Generator")
+    log_progress(job_id, "=" * 60)
+    log_progress(job_id, "")
+    return job_store.get_job(job_id)
+
+
+def open_generator(job_id, firstaid_pdf):
+    """Create the generator for a job (the First Aid index is shared)"""
+    log_progress(job_id, f"📚 Loading First Aid reference from: {Path(firstaid_pdf).name}")
+    generator = MedicalPromptGenerator(firstaid_pdf, cancel_token=cancel_tokens[job_id])
+    log_progress(job_id, f"✓ Loaded {len(generator.firstaid_content):,} characters from First Aid")
+    log_progress(job_id, "")
+    return generator
+
+
+def plan_questions(job_id, generator, input_pdf):
+    """Extract (or reuse) the questions of a job and look up what is already done"""
+    # Extract questions (once per distinct exam file)
+    log_progress(job_id, f"📄 Extracting questions from: {Path(input_pdf).name}")
+    exam_sha256 = get_catalog(Path(input_pdf).parent).content_hash(input_pdf)
+    questions = job_store.get_extraction(exam_sha256)
+    if questions is None:
+        questions = generator.extract_questions_from_pdf(input_pdf)
+        job_store.save_extraction(exam_sha256, questions)
+    else:
+        log_progress(job_id, "♻️  Reusing questions extracted earlier from an identical file")
+    update_job(job_id, total_questions=len(questions))
+    log_progress(job_id, f"✓ Extracted {len(questions)} questions")
+    log_progress(job_id, "")
+    
+    # Prompts generated earlier for the same exam and First Aid edition are reused
+    firstaid_sha256 = generator.firstaid_index.sha256
+    cached_prompts = job_store.get_cached_prompts(exam_sha256, firstaid_sha256) if firstaid_sha256 else {}
+    
+    # Questions finished before a restart are not generated again
+    completed = job_store.completed_questions(job_id)
+    if completed:
+        log_progress(job_id, f"↩️  Resuming: {len(completed)} questions already completed")
+        log_progress(job_id, "")
+    
+    return {
+        'questions': questions,
+        'exam_sha256': exam_sha256,
+        'firstaid_sha256': firstaid_sha256,
+        'cached_prompts': cached_prompts,
+        'completed': completed
+    }
+
+
+class JournalSink(Sink):
+    """Stores a job's prompts (a resumed job skips them) and caches them for identical exams"""
+    
+    def __init__(self, job_id, plan):
+        self.job_id = job_id
+        self.plan = plan
+    
+    def add(self, result):
+        index, number, prompt = result['index'], result['question_number'], result['prompt']
+        job_store.add_result(self.job_id, index, number, prompt)
+        QUESTIONS_PROCESSED.inc(source=result['source'])
         
-        log_progress("=" * 60)
-        log_progress("🚀 Starting Medical Study Prompt Generator")
-        log_progress("=" * 60)
-        log_progress("")
+        # Fallbacks from failed API calls are not worth reusing
+        if (result['source'] == 'generated' and self.plan['firstaid_sha256']
+                and result['concepts'] != FALLBACK_CONCEPTS and prompt != fallback_prompt(number)):
+            job_store.cache_prompt(self.plan['exam_sha256'], self.plan['firstaid_sha256'], index, prompt)
+
+
+class SSESink(Sink):
+    """Progress messages, current question and result events for a job's /progress subscribers"""
+    
+    def __init__(self, job_id):
+        self.job_id = job_id
+    
+    def event(self, name, **fields):
+        job_id = self.job_id
         
-        # Initialize generator
-        log_progress(f"📚 Loading First Aid reference from: {Path(firstaid_pdf).name}")
-        generator = MedicalPromptGenerator(firstaid_pdf)
-        log_progress(f"✓ Loaded {len(generator.firstaid_content):,} characters from First Aid")
-        log_progress("")
+        if name == 'question':
+            update_job(job_id, current_question=fields['index'])
+            position = f"[{fields['index']}/{fields['total']}]"
+            if fields['cached']:
+                log_progress(job_id, f"{position} ♻️  Reused prompt for Question {fields['number']}")
+            else:
+                log_progress(job_id, f"{position} Processing Question {fields['number']}...")
         
-        # Extract questions
-        log_progress(f"📄 Extracting questions from: {Path(input_pdf).name}")
-        questions = generator.extract_questions_from_pdf(input_pdf)
-        generation_status['total_questions'] = len(questions)
-        log_progress(f"✓ Extracted {len(questions)} questions")
-        log_progress("")
+        elif name == 'stage' and fields['stage'] == 'concepts':
+            log_progress(job_id, f"  → 🔍 Identifying key concepts...")
         
-        # Process each question
-        results = []
-        for i, q in enumerate(questions, 1):
-            generation_status['current_question'] = i
-            log_progress(f"[{i}/{len(questions)}] Processing Question {q['number']}...")
-            
-            # Identify concepts
-            log_progress(f"  → 🔍 Identifying key concepts...")
-            concepts = generator.identify_key_concepts(q['content'])
-            log_progress(f"  → 💡 Concepts: {concepts[:80]}...")
-            
-            # Generate prompt
-            log_progress(f"  → ✨ Generating enriched prompt...")
-            prompt = generator.generate_enriched_prompt(q['number'], q['content'], concepts)
-            
-            results.append({
-                'question_number': q['number'],
-                'prompt': prompt
-            })
-            
-            log_progress(f"  ✓ Complete!")
-            log_progress("")
+        elif name == 'concepts':
+            log_progress(job_id, f"  → 💡 Concepts: {fields['concepts'][:80]}...")
         
-        # Sort and save
-        results.sort(key=lambda x: x['question_number'])
+        elif name == 'stage' and fields['stage'] == 'prompt':
+            log_progress(job_id, f"  → ✨ Generating enriched prompt...")
         
-        import csv
-        with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['Question Number', 'Prompt'])
-            for result in results:
-                writer.writerow([result['question_number'], result['prompt']])
+        elif name == 'result':
+            # Finished prompts can be downloaded before the whole job is done
+            publish_event(job_id, {
+                'result': {
+                    'question_number': fields['question_number'],
+                    'prompt': fields['prompt']
+                },
+                'completed': job_store.count_results(job_id),
+                'timestamp': time.time()
+            })
+            if fields['source'] == 'generated':
+                log_progress(job_id, f"  ✓ Complete!")
+                log_progress(job_id, "")
+
+
+def job_pipeline(job_id, generator, plan, executor=None):
+    """Pipeline that journals a job's prompts and streams its progress"""
+    return Pipeline(generator, executor,
+                    sinks=[JournalSink(job_id, plan), SSESink(job_id)],
+                    checkpoint=lambda: check_cancelled(job_id))
+
+
+def finish_job(job_id, plan, output_csv):
+    """Write the CSV from the stored results and mark the job completed"""
+    # Results come back sorted by question number
+    results = job_store.get_results(job_id)
+    
+    with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['Question Number', 'Prompt'])
+        for result in results:
+            writer.writerow([result['question_number'], result['prompt']])
+    
+    update_job(job_id, current_question=len(plan['questions']), output_file=output_csv)
+    
+    log_progress(job_id, "=" * 60)
+    log_progress(job_id, f"🎉 Successfully generated {len(results)} study prompts!")
+    log_progress(job_id, f"💾 Output saved to: {Path(output_csv).name}")
+    log_progress(job_id, "=" * 60)
+    log_progress(job_id, "")
+    log_progress(job_id, "✅ COMPLETE! You can now download your CSV file.")
+    update_job(job_id, state='completed')
+    JOBS_COMPLETED.inc()
+
+
+def cancel_job(job_id):
+    """Mark a job cancelled; its finished prompts stay downloadable"""
+    completed = job_store.count_results(job_id)
+    log_progress(job_id, "=" * 60)
+    log_progress(job_id, f"⏹️  Generation cancelled. {completed} completed prompts were kept.")
+    log_progress(job_id, "=" * 60)
+    update_job(job_id, state='cancelled')
+    JOBS_CANCELLED.inc()
+
+
+def check_cancelled(job_id):
+    """Raise GenerationCancelled if the job was cancelled here or by another server process"""
+    token = cancel_tokens[job_id]
+    if not token.cancelled and job_store.cancel_requested(job_id):
+        token.cancel()
+    token.raise_if_cancelled()
+
+
+def end_job(job_id):
+    """Release what a running job holds in this process"""
+    with cancel_tokens_lock:
+        cancel_tokens.pop(job_id, None)
+    JOBS_RUNNING.dec()
+
+
+def request_cancellation(job_id):
+    """
+    Cancel a queued or running job; returns 'cancelled', 'cancelling' or None
+    
+    A running job in this process stops within one request: its token
+    makes the pending API call return at once. A job running in another
+    server process sees the flag in the store at its next check.
+    """
+    outcome = job_store.request_cancel(job_id)
+    if outcome == 'cancelled':
+        log_progress(job_id, "⏹️  Cancelled before it started")
+        JOBS_CANCELLED.inc()
+    elif outcome == 'cancelling':
+        log_progress(job_id, "⏹️  Cancelling...")
+        with cancel_tokens_lock:
+            token = cancel_tokens.get(job_id)
+        if token:
+            token.cancel()
+    return outcome
+
+
+def fail_job(job_id, error):
+    """Record an exception and mark the job failed"""
+    log_progress(job_id, f"❌ Error: {str(error)}")
+    # Built from the exception itself, since the async server calls this on another thread
+    log_progress(job_id, ''.join(traceback.format_exception(type(error), error, error.__traceback__)))
+    update_job(job_id, state='failed', error=str(error))
+    JOBS_FAILED.inc()
+
+
+def run_generation(job_id):
+    """Run (or resume) a stored job on a worker thread"""
+    # Another server process may have picked the job up first
+    job = begin_job(job_id)
+    if not job:
+        return
+    
+    try:
+        generator = open_generator(job_id, job['firstaid_pdf'])
+        plan = plan_questions(job_id, generator, job['input_pdf'])
         
-        generation_status['output_file'] = output_csv
+        # Process each question (PIPELINE_WORKERS at once)
+        outcome = job_pipeline(job_id, generator, plan).run(
+            plan['questions'], plan['completed'], plan['cached_prompts'])
         
-        log_progress("=" * 60)
-        log_progress(f"🎉 Successfully generated {len(results)} study prompts!")
-        log_progress(f"💾 Output saved to: {Path(output_csv).name}")
-        log_progress("=" * 60)
-        log_progress("")
-        log_progress("✅ COMPLETE! You can now download your CSV file.")
+        if outcome['status'] == 'cancelled':
+            cancel_job(job_id)
+        else:
+            finish_job(job_id, plan, job['output_csv'])
         
     except Exception as e:
-        error_msg = f"❌ Error: {str(e)}"
-        log_progress(error_msg)
-        generation_status['error'] = str(e)
-        import traceback
-        log_progress(traceback.format_exc())
+        fail_job(job_id, e)
     
     finally:
-        generation_status['is_running'] = False
+        end_job(job_id)
 
 
 @app.route('/')
@@ -128,21 +415,11 @@ def index():
     """Main page"""
     api_key = os.getenv('OPENAI_API_KEY')
     
-    # Auto-detect PDFs
-    current_dir = Path.cwd()
-    
-    # Find first aid PDF
-    firstaid_pdf = None
-    for name in ['first aid.pdf', 'firstaid.pdf', 'First Aid.pdf']:
-        if (current_dir / name).exists():
-            firstaid_pdf = name
-            break
-    
-    # Find input PDFs
-    input_pdfs = []
-    for pdf in current_dir.glob('*.pdf'):
-        if pdf.name.lower() not in ['first aid.pdf', 'firstaid.pdf']:
-            input_pdfs.append(pdf.name)
+    # Auto-detect PDFs (cached until the directory changes)
+    catalog = get_catalog(Path.cwd())
+    firstaid = catalog.firstaid_pdf()
+    firstaid_pdf = firstaid.name if firstaid else None
+    input_pdfs = [pdf.name for pdf in catalog.exam_pdfs()]
     
     input_pdf = input_pdfs[0] if input_pdfs else None
     
@@ -180,116 +457,349 @@ def save_api_key():
 
 @app.route('/api/start_generation', methods=['POST'])
 def start_generation():
-    """Start the generation process"""
-    global generation_status
+    """Queue a generation job and return its ID"""
+    job, error = create_generation_job(request.json)
+    if error:
+        return jsonify({'success': False, 'error': error})
     
-    if generation_status['is_running']:
-        return jsonify({'success': False, 'error': 'Generation already in progress'})
-    
-    data = request.json
+    submit_job(job['id'])
+    return jsonify({'success': True, 'job_id': job['id']})
+
+
+def create_generation_job(data):
+    """Validate a start request and store a queued job; returns (job, error message)"""
     input_pdf = data.get('input_pdf')
     firstaid_pdf = data.get('firstaid_pdf')
     input_nature = data.get('input_nature')
     num_questions = data.get('num_questions')
+    # Uploaded files are stored under their hash; input_name keeps the original name
+    input_name = data.get('input_name') or input_pdf
     
     # Validate inputs
     if not input_pdf or not Path(input_pdf).exists():
-        return jsonify({'success': False, 'error': 'Input PDF not found'})
+        return None, 'Input PDF not found'
     
     if not firstaid_pdf or not Path(firstaid_pdf).exists():
-        return jsonify({'success': False, 'error': 'First Aid PDF not found'})
+        return None, 'First Aid PDF not found'
     
     # Generate output filename
-    output_csv = Path(input_pdf).stem + '_study_prompts.csv'
+    output_csv = Path(input_name).stem + '_study_prompts.csv'
     
-    # Clear the queue
-    while not progress_queue.empty():
-        try:
-            progress_queue.get_nowait()
-        except:
-            break
-    
-    # Reset status
-    generation_status = {
-        'is_running': True,
-        'current_question': 0,
-        'total_questions': 0,
-        'current_message': '',
-        'error': None,
-        'output_file': None
-    }
+    # Two jobs must not write the same CSV (different uploads can share a name)
+    job = job_store.create_job(input_pdf, firstaid_pdf, output_csv, input_nature, num_questions)
+    if not job:
+        return None, f'A job writing {output_csv} is already in progress'
+    return job, None
+
+
+@app.route('/api/upload', methods=['POST'])
+def upload_pdf():
+    """
+    Upload an exam PDF as the raw request body (?filename=<original name>)
     
-    # Start generation in background thread
-    thread = threading.Thread(
-        target=run_generation,
-        args=(input_pdf, firstaid_pdf, output_csv, input_nature, num_questions),
-        daemon=True
-    )
-    thread.start()
+    The body is spooled to disk in chunks and hashed on the way, so large
+    files never sit in memory. Files are stored as uploads/<sha256>.pdf;
+    uploading the same file again reuses the stored copy, and its question
+    extraction and prompts are cached by the same hash.
+    """
+    filename = Path(request.args.get('filename') or 'upload.pdf').name
     
-    return jsonify({'success': True})
+    if request.mimetype.startswith('multipart/'):
+        return jsonify({'success': False, 'error': 'Send the PDF as the raw request body'}), 400
+    if request.content_length and request.content_length > MAX_UPLOAD_BYTES:
+        return jsonify({'success': False, 'error': 'File is too large'}), 413
+    
+    UPLOAD_DIR.mkdir(exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix='.part')
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        header = b''
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                chunk = request.stream.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    return jsonify({'success': False, 'error': 'File is too large'}), 413
+                
+                if len(header) < 5:
+                    header += chunk[:5 - len(header)]
+                digest.update(chunk)
+                f.write(chunk)
+        
+        if not header.startswith(b'%PDF-'):
+            return jsonify({'success': False, 'error': 'File is not a PDF'}), 400
+        
+        sha256 = digest.hexdigest()
+        stored_path = UPLOAD_DIR / f"{sha256}.pdf"
+        deduplicated = stored_path.exists()
+        if not deduplicated:
+            os.replace(tmp_path, stored_path)
+        # The digest was taken while spooling, so jobs on this file never re-read it
+        get_catalog(UPLOAD_DIR).record_hash(stored_path, sha256)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    return jsonify({
+        'success': True,
+        'path': stored_path.as_posix(),
+        'filename': filename,
+        'sha256': sha256,
+        'size': size,
+        'deduplicated': deduplicated
+    })
 
 
-@app.route('/api/progress')
-def progress():
-    """Server-sent events for real-time progress"""
+def job_or_404(job_id):
+    """Resolve a job ID or 'latest' to a stored job, or None"""
+    if job_id == 'latest':
+        latest = job_store.list_jobs(limit=1)
+        return latest[0] if latest else None
+    return job_store.get_job(job_id)
+
+
+@app.route('/api/jobs')
+def list_jobs():
+    """List recent jobs, newest first"""
+    statuses = [job_status_dict(job) for job in job_store.list_jobs()]
+    return jsonify({'jobs': statuses, 'max_concurrent_jobs': MAX_CONCURRENT_JOBS})
+
+
+@app.route('/api/jobs/<job_id>/progress')
+def job_progress(job_id):
+    """
+    Server-sent events for real-time progress of one job
+    
+    Every event carries its ID from the job's event log. Reconnecting
+    clients send Last-Event-ID (or ?last_event_id=) and get everything
+    after it replayed, so any number of tabs see the full history.
+    """
+    job = job_or_404(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    job_id = job['id']
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+    
     def generate():
+        SSE_SUBSCRIBERS.inc()
+        try:
+            yield from stream_events(after_id=last_event_id)
+        finally:
+            # Also runs when the client disconnects and the generator is closed
+            SSE_SUBSCRIBERS.dec()
+    
+    def stream_events(after_id):
         while True:
-            try:
-                # Get message from queue (with timeout)
-                msg = progress_queue.get(timeout=1.0)
-                yield f"data: {json.dumps(msg)}\n\n"
-            except queue.Empty:
+            seen = current_change()
+            
+            # Read the state first so no event logged before completion is missed
+            finished = job_store.get_job(job_id)['state'] not in ('queued', 'running')
+            events = job_store.get_events(job_id, after_id)
+            for event_id, payload in events:
+                yield f"id: {event_id}\ndata: {json.dumps(payload)}\n\n"
+                after_id = event_id
+            
+            if events:
+                continue
+            if finished:
+                yield "event: done\ndata: {}\n\n"
+                break
+            
+            if not wait_for_change(seen, EVENT_POLL_SECONDS):
                 # Send heartbeat
                 yield f"data: {json.dumps({'heartbeat': True})}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/jobs/<job_id>/status')
+def job_status(job_id):
+    """
+    Get current status of one job
+    
+    Responses carry an ETag of the job's version, and If-None-Match gets a
+    304 while it is unchanged. With ?since=<version> the request blocks (up
+    to LONG_POLL_SECONDS) until the version differs, so clients can wait for
+    the next change instead of polling on a timer. The version follows state,
+    progress counts, error and output; current_message alone does not change
+    it (the progress stream carries every message).
+    """
+    job = job_or_404(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    since = request.args.get('since', type=int)
+    if since is not None:
+        deadline = time.monotonic() + LONG_POLL_SECONDS
+        while job['version'] == since:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            seen = current_change()
+            job = job_store.get_job(job['id'])
+            if job['version'] != since:
+                break
+            wait_for_change(seen, min(EVENT_POLL_SECONDS, remaining))
+    
+    etag = f'{job["id"]}-{job["version"]}'
+    if etag in request.if_none_match or (since is not None and job['version'] == since):
+        response = Response(status=304)
+    else:
+        response = jsonify(job_status_dict(job))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    """Stop a queued or running job, keeping the prompts it finished"""
+    job = job_or_404(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    
+    if not request_cancellation(job['id']):
+        return jsonify({'success': False, 'error': f"Job is already {job['state']}"}), 409
+    
+    return jsonify({'success': True, 'state': job_store.get_job(job['id'])['state']})
+
+
+@app.route('/api/jobs/<job_id>/results')
+def job_results(job_id):
+    """Page through the prompts a job has finished so far (?offset=&limit=)"""
+    job = job_or_404(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', RESULTS_PAGE_SIZE, type=int), 1), 1000)
+    
+    return jsonify({
+        'job_id': job['id'],
+        'state': job['state'],
+        'total_questions': job['total_questions'],
+        'completed': job_store.count_results(job['id']),
+        'offset': offset,
+        'limit': limit,
+        'results': job_store.get_results(job['id'], offset, limit)
+    })
+
+
+@app.route('/api/jobs/<job_id>/download')
+def job_download(job_id):
+    """
+    Download a job's prompts as CSV
+    
+    The CSV is streamed from the stored results page by page, so it can be
+    downloaded while the job is still running (with the prompts done so far).
+    """
+    job = job_or_404(job_id)
+    if not job:
+        return jsonify({'error': 'File not found'}), 404
+    
+    job_id = job['id']
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['Question Number', 'Prompt'])
+        
+        offset = 0
+        while True:
+            page = job_store.get_results(job_id, offset, RESULTS_PAGE_SIZE)
+            for result in page:
+                writer.writerow([result['question_number'], result['prompt']])
+            
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
             
-            # If generation is complete and queue is empty, close
-            if not generation_status['is_running'] and progress_queue.empty():
-                time.sleep(2)  # Give time for final messages
+            if len(page) < RESULTS_PAGE_SIZE:
                 break
+            offset += len(page)
     
-    return Response(generate(), mimetype='text/event-stream')
+    filename = Path(job['output_csv']).name
+    if job['state'] != 'completed':
+        filename = Path(filename).stem + '_partial.csv'
+    
+    return Response(generate(), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+# Single-job endpoints kept for older clients; they follow the latest job
+@app.route('/api/progress')
+def progress():
+    """Server-sent events for the latest job"""
+    return job_progress('latest')
 
 
 @app.route('/api/status')
 def status():
-    """Get current status"""
-    return jsonify(generation_status)
+    """Get status of the latest job"""
+    job = job_or_404('latest')
+    if not job:
+        return jsonify({'is_running': False, 'current_question': 0, 'total_questions': 0,
+                        'current_message': '', 'error': None, 'output_file': None})
+    return job_status(job['id'])
 
 
 @app.route('/api/download')
 def download():
-    """Download the generated CSV"""
-    output_file = generation_status.get('output_file')
-    if output_file and Path(output_file).exists():
-        return send_file(output_file, as_attachment=True)
-    return jsonify({'error': 'File not found'}), 404
+    """Download the CSV of the latest job"""
+    return job_download('latest')
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics of this server process"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 @app.route('/api/list_pdfs')
 def list_pdfs():
     """List available PDF files"""
-    current_dir = Path.cwd()
-    
-    # Find first aid PDF
-    firstaid_pdf = None
-    for name in ['first aid.pdf', 'firstaid.pdf', 'First Aid.pdf']:
-        if (current_dir / name).exists():
-            firstaid_pdf = name
-            break
-    
-    # Find input PDFs
-    input_pdfs = []
-    for pdf in current_dir.glob('*.pdf'):
-        if pdf.name.lower() not in ['first aid.pdf', 'firstaid.pdf']:
-            input_pdfs.append(pdf.name)
+    catalog = get_catalog(Path.cwd())
+    firstaid = catalog.firstaid_pdf()
+    exam_pdfs = catalog.exam_pdfs()
     
     return jsonify({
-        'firstaid_pdf': firstaid_pdf,
-        'input_pdfs': input_pdfs
+        'firstaid_pdf': firstaid.name if firstaid else None,
+        'input_pdfs': [pdf.name for pdf in exam_pdfs],
+        'pdfs': [dict(catalog.info(pdf), pages=catalog.page_count(pdf)) for pdf in exam_pdfs]
     })
 
 
+def start_background_work():
+    """Preload First Aid and resume unfinished jobs on the thread pool; returns the resumed job IDs"""
+    # Extract the First Aid reference in the background so the first job finds it warm
+    firstaid = get_catalog(Path.cwd()).firstaid_pdf()
+    if firstaid:
+        threading.Thread(target=preload_firstaid, args=([firstaid],),
+                         name='firstaid-preload', daemon=True).start()
+    
+    # Jobs interrupted by a restart continue from their last completed question.
+    # Every server process does this; claim_job makes sure each job runs once.
+    return resume_unfinished_jobs()
+
+
+# `python web_app.py` runs with the debug reloader: its first process only watches
+# the source files and restarts the serving child (WERKZEUG_RUN_MAIN=true), so it
+# must not claim jobs or preload First Aid
+RELOADER_WATCHER = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+resumed_job_ids = [] if ASYNC_MODE or RELOADER_WATCHER else start_background_work()
+
+
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
     templates_dir = Path(__file__).parent / 'templates'
@@ -300,6 +810,11 @@ if __name__ == '__main__':
     print("=" * 60)
     print()
     print("🚀 Starting server...")
+    print(f"⚙️  Up to {MAX_CONCURRENT_JOBS} generation jobs run at once (MAX_CONCURRENT_JOBS)")
+    print(f"⚙️  {PIPELINE_WORKERS} question(s) at once per job (PIPELINE_WORKERS)")
+    print(f"🗄️  Job store: {JOB_DB_PATH}")
+    if resumed_job_ids:
+        print(f"↩️  Resuming {len(resumed_job_ids)} unfinished job(s)")
     print()
     print("Open your browser and go to:")
     print()